@@ -1,9 +1,114 @@
 # imports
+import json
+import multiprocessing
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 from sklearn.cluster import DBSCAN, KMeans
+from sklearn.metrics import silhouette_score
 from sklearn.neighbors import NearestNeighbors
 
+# number of points sampled for the silhouette score of a sweep
+SILHOUETTE_SAMPLE = 2000
+
+# standardized data and neighbor graph shared by the sweep workers
+SWEEP_DATA = {}
+
+def auto_scale(n):
+    """Default scale of min_points for n data points"""
+    return max(2, np.rint(n/1000))
+
+def graph_within(graph, eps):
+    """Neighbor graph cut down to the distances within eps"""
+    keep = graph.data<=eps
+    kept = np.concatenate(([0], np.cumsum(keep)))
+    return csr_matrix((graph.data[keep], graph.indices[keep], kept[graph.indptr]),
+                      shape=graph.shape)
+
+def dbscan_kmeans(X, eps, min_points, graph=None):
+    """Run DBSCAN and K-means in series
+    
+    Inputs:
+        X: standardized dataframe (n_data, n_features)
+        eps: eps parameter for dbscan
+        min_points: min_points parameter for dbscan
+        graph [None]: sparse neighbor distances of X, sorted by row, out
+                      to at least eps, None for dbscan to search X itself
+        
+    Outputs:
+        label_dbscan: dbscan labels, -1 for noise
+        centroids_init: centroids of the dbscan clusters
+        label_kmeans: K-means labels started from the centroids, the
+                      dbscan labels when dbscan found no cluster
+        centroids: centroids of the K-means clusters
+    """
+    # fit and predict labels with dbscan
+    if graph is None:
+        dbscan = DBSCAN(eps=eps,
+                        min_samples=min_points,
+                        metric="euclidean",)
+        label_dbscan = dbscan.fit_predict(X)
+    else:
+        dbscan = DBSCAN(eps=eps,
+                        min_samples=min_points,
+                        metric="precomputed",)
+        label_dbscan = dbscan.fit_predict(graph)
+    
+    # use pandas to calculate centroids, dropping the noise label
+    X_grouped = pd.concat([X.reset_index(drop=True),
+                           pd.Series(label_dbscan, name="ptype")],
+                           axis=1)
+    centroids_init = X_grouped.groupby("ptype").mean().drop(-1, errors="ignore")
+    if centroids_init.shape[0]==0:
+        return label_dbscan, centroids_init, label_dbscan, pd.DataFrame(columns=X.columns, dtype=float)
+    
+    # perform K-means
+    kmeans = KMeans(n_clusters=centroids_init.shape[0],
+                    init=centroids_init,
+                    n_init=1)
+    label_kmeans = kmeans.fit_predict(X)
+    centroids = pd.DataFrame(kmeans.cluster_centers_, columns=X.columns)
+    
+    # clean up
+    return label_dbscan, centroids_init, label_kmeans, centroids
+
+def sweep_init(X, graph):
+    """Share the sweep data with a worker process"""
+    SWEEP_DATA["X"] = X
+    SWEEP_DATA["full"] = graph
+    SWEEP_DATA["graph"] = graph
+    SWEEP_DATA["eps"] = np.inf
+
+def sweep_setting(setting):
+    """Cluster and score one (q, scale, eps, min_points) sweep setting"""
+    X = SWEEP_DATA["X"]
+    q, scale, eps, min_points = setting
+    # cut the last graph when eps shrinks, the full graph otherwise
+    if eps > SWEEP_DATA["eps"]:
+        SWEEP_DATA["graph"] = SWEEP_DATA["full"]
+    graph = graph_within(SWEEP_DATA["graph"], eps)
+    SWEEP_DATA["graph"] = graph
+    SWEEP_DATA["eps"] = eps
+    label_dbscan, centroids_init, label_kmeans, centroids = dbscan_kmeans(X, eps, min_points, graph)
+    
+    # silhouette score on a fixed sample, undefined for a single cluster
+    nclust = len(np.unique(label_kmeans))
+    if 1 < nclust < X.shape[0]:
+        score = silhouette_score(X, label_kmeans,
+                                 sample_size=min(X.shape[0], SILHOUETTE_SAMPLE),
+                                 random_state=0)
+    else:
+        score = np.nan
+    
+    # clean up
+    return {"q": q,
+            "scale": scale,
+            "eps": eps,
+            "min_points": min_points,
+            "n_clusters": centroids_init.shape[0],
+            "n_noise": int(np.sum(label_dbscan==-1)),
+            "score": score,}, label_kmeans
+
 class DBSCANKMeans():
     """Class to perform DBSCAN and Kmeans in series"""
     def __init__(self, **params):
@@ -37,18 +142,12 @@ class DBSCANKMeans():
             min_points: min_points parameter for dbscan
         """
         # pass variable
-        self.X = X
+        self.X = self.standardize(X, **stand)
         if self.scale==0:
-            self.scale = max(2, np.rint(self.X.shape[0]/1000))
-        
-        # standardize features
-        if stand:
-            if "stand" in stand:
-                if bool(stand["stand"]):
-                    self.X = (self.X-self.X.mean(axis=0))/self.X.std(axis=0)
+            self.scale = auto_scale(self.X.shape[0])
         
         # set min_points parameter
-        self.min_points = self.scale*self.X.shape[1]
+        self.min_points = int(self.scale*self.X.shape[1])
 
         # initialize nearest-neighbor object
         nbrs = NearestNeighbors(n_neighbors=self.min_points,
@@ -73,62 +172,161 @@ class DBSCANKMeans():
     def fit_predict(self, X, **stand):
         """Fit dbscan parameters to data
         
+        The means and stds of the standardization are kept in means and
+        stds, and the K-means centroids, in standardized units, in
+        centroids, for predict.
+        
         Inputs:
             X: dataframe (n_data, n_features)
             stand [False]: to standardize data or not (optional)            
         Output:
             label_kmeans: labeled pitches
         """
-         # pass variable
-        self.X = X
-        if self.scale==0:
-            self.scale = max(2, np.rint(self.X.shape[0]/1000))
+        # fit parameters
+        self.fit(X, **stand)
+        
+        # dbscan, then K-means from its centroids
+        (self.label_dbscan, self.centroids_init,
+         self.label_kmeans, self.centroids) = dbscan_kmeans(self.X, self.eps, self.min_points)
+        self.k = self.centroids_init.shape[0]
+
+        # clean up
+        return self.label_kmeans
+        
+    def predict(self, X):
+        """Label data with the nearest K-means centroid
+        
+        Inputs:
+            X: dataframe (n_data, n_features) with the features fit_predict
+               was given, in the same units
+        Output:
+            labels: index of the nearest centroid, -1 if there is none
+        """
+        # standardize like the fitted data
+        Xs = ((X[self.means.index]-self.means)/self.stds).values
+        centroids = self.centroids.values
+        if centroids.shape[0]==0:
+            return np.full(Xs.shape[0], -1)
+        
+        # squared distances to every centroid at once
+        dist = (np.sum(Xs**2, axis=1)[:, np.newaxis]
+                -2*np.dot(Xs, centroids.T)
+                +np.sum(centroids**2, axis=1)[np.newaxis, :])
+        
+        # clean up
+        return np.argmin(dist, axis=1)
+        
+    def model(self):
+        """Fitted standardization and centroids as a json-ready dictionary"""
+        return {"features": list(self.means.index),
+                "means": self.means.tolist(),
+                "stds": self.stds.tolist(),
+                "centroids": self.centroids.values.tolist(),}
+        
+    def to_json(self):
+        """Serialize the fitted model to a json string"""
+        return json.dumps(self.model())
+        
+    @classmethod
+    def from_model(cls, model):
+        """Initialize a fitted object for predict
+        
+        Inputs:
+            model: dictionary from model, or its json string from to_json
+        """
+        if not isinstance(model, dict):
+            model = json.loads(model)
+        dbk = cls()
+        dbk.means = pd.Series(model["means"], index=model["features"], dtype=float)
+        dbk.stds = pd.Series(model["stds"], index=model["features"], dtype=float)
+        dbk.centroids = pd.DataFrame(model["centroids"], columns=model["features"], dtype=float)
+        dbk.k = dbk.centroids.shape[0]
+        return dbk
+        
+    def standardize(self, X, **stand):
+        """Standardize features if asked to, keeping the means and stds
+        
+        Inputs:
+            X: dataframe (n_data, n_features)
+            stand [False]: to standardize data or not (optional)
             
-        # standardize features
+        Output:
+            X: standardized dataframe, X itself if not asked to
+        """
+        self.means = pd.Series(0.0, index=X.columns)
+        self.stds = pd.Series(1.0, index=X.columns)
         if stand:
             if "stand" in stand:
                 if bool(stand["stand"]):
-                    self.X = (self.X-self.X.mean(axis=0))/self.X.std(axis=0)
+                    self.means = X.mean(axis=0)
+                    self.stds = X.std(axis=0)
+                    return (X-self.means)/self.stds
+        return X
         
-        # set min_points parameter
-        self.min_points = int(self.scale*self.X.shape[1])
-
-        # initialize nearest-neighbor object
-        nbrs = NearestNeighbors(n_neighbors=self.min_points,
-                                metric="euclidean")
+    def sweep(self, X, qs, scales, processes=1, **stand):
+        """Cluster data over a grid of q and scale settings
         
-        # fit nearest-neighbors
+        The k nearest neighbors are found once at the largest min_points
+        of the grid and sliced for smaller ones, and one neighbor graph out
+        to the largest eps is shared by every dbscan run.
+        
+        Inputs:
+            X: dataframe (n_data, n_features)
+            qs: list of quantiles (percent) for the eps estimate
+            scales: list of min_points scales, 0 for the default scale
+            processes [1]: number of processes clustering settings in parallel
+            stand [False]: to standardize data or not (optional)
+            
+        Outputs:
+            sweep_results: dataframe of eps, min_points, number of clusters,
+                           number of noise points and silhouette score, indexed
+                           by (q, scale)
+            sweep_labels: dictionary of K-means labels keyed by (q, scale)
+        """
+        # pass variable
+        self.X = self.standardize(X, **stand)
+        ndata, nfeat = self.X.shape
+        
+        # min_points of every scale and kNN at the largest one
+        min_points = dict((scale, int((scale or auto_scale(ndata))*nfeat)) for scale in scales)
+        nbrs = NearestNeighbors(n_neighbors=max(min_points.values()),
+                                metric="euclidean")
         nbrs_fit = nbrs.fit(self.X)
         self.kdist, self.kind = nbrs_fit.kneighbors(self.X)
         
-        # estimate eps paramter
-        self.eps = np.percentile(self.kdist[:, -1], q=self.q)
+        # eps of every setting from the sliced k-distances
+        settings = []
+        for scale in scales:
+            for q in qs:
+                eps = np.percentile(self.kdist[:, min_points[scale]-1], q=q)
+                settings.append((q, scale, eps, min_points[scale]))
         
-        # initialize dbscan object
-        dbscan = DBSCAN(eps=self.eps,
-                        min_samples=self.min_points,
-                        metric="euclidean",)
+        # one graph out to the largest eps, cut down setting by setting
+        settings.sort(key=lambda setting: -setting[2])
+        self.graph = nbrs_fit.radius_neighbors_graph(self.X,
+                                                     radius=max(setting[2] for setting in settings),
+                                                     mode="distance",
+                                                     sort_results=True)
         
-        # fit and predict labels with dbscan
-        self.label_dbscan = dbscan.fit_predict(self.X)
-
-        # use pandas to calculate centroids
-        self.X_grouped = pd.concat([self.X.reset_index(drop=True),
-                                    pd.Series(self.label_dbscan, name="ptype")],
-                                    axis=1)
-
-        # calculate centroids and number of clusters
-        self.centroids_init = self.X_grouped.groupby("ptype").mean().iloc[1:, :]
-        self.k = self.centroids_init.shape[0]
+        # cluster every setting
+        if processes > 1:
+            pool = multiprocessing.Pool(processes, sweep_init, (self.X, self.graph))
+            try:
+                results = pool.map(sweep_setting, settings)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            sweep_init(self.X, self.graph)
+            results = [sweep_setting(setting) for setting in settings]
+            SWEEP_DATA.clear()
+        
+        # collect scores and labels
+        self.sweep_results = pd.DataFrame([result[0] for result in results]).set_index(["q", "scale"]).sort_index()
+        self.sweep_labels = dict(((result[0]["q"], result[0]["scale"]), result[1]) for result in results)
         
-        # perform K-means
-        kmeans = KMeans(n_clusters=self.k,
-                        init=self.centroids_init,
-                        n_init=1)
-        self.label_kmeans = kmeans.fit_predict(self.X)
-
         # clean up
-        return self.label_kmeans
+        return self.sweep_results, self.sweep_labels
         
     def plot_knn(self):
         """Return plot of sorted distances for a given K nearest neighbor"""     
@@ -125,7 +125,8 @@ class _SimpleElementPath(object):
 
 try:
     from . import ElementPath
-except ImportError:
+except (ImportError, ValueError):
+    # not imported as part of a package
     ElementPath = _SimpleElementPath()
 
 ##
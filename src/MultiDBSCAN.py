@@ -1,6 +1,6 @@
-import sys
+import heapq
+import numpy as np
 from sklearn.neighbors import NearestNeighbors
-sys.setrecursionlimit(10000)
 
 class MultiDBSCAN():
     """Multi-density DBSCAN
@@ -34,16 +34,23 @@ class MultiDBSCAN():
         self.k_dist, self.k_ind = nbrs_fit.kneighbors(self.X)
     
         # create average distance of k nearest neighbors for each point
-        self.aDST = dict(enumerate(np.sum(self.k_dist, axis=1)/(self.k-1)))
+        self.aDST = np.sum(self.k_dist, axis=1)/(self.k-1)
+        self.assigned = np.zeros(self.aDST.shape[0], dtype=bool)
 
-        # initialize cluster at densest point
+        # seeds come off a heap ordered by average distance, ties by index
+        seeds = list(zip(self.aDST.tolist(), range(self.aDST.shape[0])))
+        heapq.heapify(seeds)
+
+        # initialize cluster at densest unassigned point
         self.clusters = {}
         self.nclust = 0
-        while self.aDST:
-            idat = min(self.aDST, key=self.aDST.get)
+        while seeds:
+            idat = heapq.heappop(seeds)[1]
+            if self.assigned[idat]:
+                continue
             self.clusters[self.nclust] = [idat]
             self.cluster_aDST = self.aDST[idat]
-            self.aDST.pop(idat, None)
+            self.assigned[idat] = True
             self.cluster_expand(idat)
             if len(self.clusters[self.nclust])<20:
                 self.clusters.pop(self.nclust, None)
@@ -53,12 +60,25 @@ class MultiDBSCAN():
         return self.clusters
 
     def cluster_expand(self, idat):
-        """Expand cluster recursively"""
-        for qq in self.k_ind[idat, :]:
-            if (qq in self.aDST) and (self.aDST[qq]<=self.var*self.cluster_aDST):
+        """Expand cluster depth first from an explicit frontier
+        
+        Each frontier entry is a point and the position of the next
+        neighbor to visit, so points join in the same order as a
+        recursive expansion and the running cluster average matches.
+        """
+        cluster = self.clusters[self.nclust]
+        frontier = [[idat, 0]]
+        while frontier:
+            top = frontier[-1]
+            if top[1]==self.k:
+                frontier.pop()
+                continue
+            qq = self.k_ind[top[0], top[1]]
+            top[1] += 1
+            if (not self.assigned[qq]) and (self.aDST[qq]<=self.var*self.cluster_aDST):
                 # add index to cluster
-                self.clusters[self.nclust].append(qq)
-                lcluster = len(self.clusters[self.nclust])
+                cluster.append(qq)
+                lcluster = len(cluster)
                 self.cluster_aDST = (self.cluster_aDST*(lcluster-1)+self.aDST[qq])/lcluster
-                self.aDST.pop(qq, None)
-                self.cluster_expand(qq)
\ No newline at end of file
+                self.assigned[qq] = True
+                frontier.append([qq, 0])
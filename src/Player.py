@@ -1,154 +1,681 @@
 # imports
 import pandas as pd
+import collections
+import hashlib
 import sqlite3
+import tempfile
+import os
+from player_queries import (PLAYER_IDS, INFO, PITCH_GAMES, HIT_GAMES,
+        PITCHFX_COLUMNS, PITCHFX_EVENT_COLUMNS, PITCHES, PITCHES_AGAINST,
+        PITCH_EVENTS, HIT_EVENTS, BATCH_TABLE, BATCH_INFO, BATCH_PITCH_GAMES,
+        BATCH_HIT_GAMES, BATCH_PITCHES, BATCH_PITCHES_AGAINST,
+        BATCH_PITCH_EVENTS, BATCH_HIT_EVENTS, QUERIES)
+
+# dtypes of the pitchfx columns in compact frames
+COMPACT_DTYPES = {
+    # ids and times
+    "game_id": "int32",
+    "pitch_num": "int16",
+    "at_bat": "int16",
+    "time": "int32",
+    "cur_event": "int16",
+    "pitcher_id": "int32",
+    "batter_id": "int32",
+    "pre_1b": "int32",
+    "pre_2b": "int32",
+    "pre_3b": "int32",
+    # counts, innings and outs
+    "pre_balls": "int8",
+    "post_balls": "int8",
+    "pre_strike": "int8",
+    "post_strike": "int8",
+    "inning": "int8",
+    "is_top_inning": "int8",
+    "pre_out": "int8",
+    }
+for name in ["start_speed", "end_speed", "sz_top", "sz_bot", "pfx_x", "pfx_z",
+        "px", "pz", "x", "y", "x0", "y0", "z0", "vx0", "vy0", "vz0", "ax", "ay",
+        "az", "break_y", "break_angle", "break_length", "spin_dir", "spin_rate"]:
+    COMPACT_DTYPES[name] = "float32"
+
+# pitchfx columns stored as categoricals in compact frames
+COMPACT_CATEGORIES = ["pitch_type", "description", "outcome"]
+
+
+def pitch_fields(params):
+    """Compile the options of the pitch queries into sql
+
+    Inputs:
+        params: options of Player.pitches
+
+    Outputs:
+        fields: columns and filters to format the pitch queries with
+        args: parameters of the filters, bound after the player ids
+    """
+    # columns to return
+    columns = params.get("columns")
+    if columns is None:
+        columns = PITCHFX_COLUMNS
+        names = [name.strip() for name in PITCHFX_COLUMNS.split(",")]
+    else:
+        names = list(columns)
+        known = [name.strip() for name in PITCHFX_COLUMNS.split(",")] + PITCHFX_EVENT_COLUMNS
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise ValueError("unknown pitchfx columns: %s" %(", ".join(unknown)))
+        columns = ", ".join(names)
+
+    # filters on the game
+    filters = []
+    args = []
+    games = []
+    if params.get("start") is not None:
+        games.append("date>=?")
+        args.append(int(params["start"]))
+    if params.get("end") is not None:
+        games.append("date<=?")
+        args.append(int(params["end"]))
+    if params.get("game_types") is not None:
+        games.append("game_type IN (%s)" %(", ".join("?"*len(params["game_types"]))))
+        args.extend(params["game_types"])
+    if games:
+        filters.append("pitchfx.game_id IN (SELECT game_id FROM games WHERE %s)" %(" AND ".join(games)))
+
+    # filters on the pitch
+    if params.get("pitch_types") is not None:
+        filters.append("pitch_type IN (%s)" %(", ".join("?"*len(params["pitch_types"]))))
+        args.extend(params["pitch_types"])
+    if params.get("balls") is not None:
+        filters.append("pre_balls=?")
+        args.append(int(params["balls"]))
+    if params.get("strikes") is not None:
+        filters.append("pre_strike=?")
+        args.append(int(params["strikes"]))
+    if bool(params.get("clean", False)):
+        filters.extend("%s IS NOT NULL" %(name) for name in names)
+        filters.append("pitch_type NOT IN ('IN', 'PO')")
+
+    fields = {"columns": columns, "filters": "".join("\n        AND "+f for f in filters)}
+    return fields, args
+
+
+class CompactSchema():
+    """Compact dtypes of the pitchfx columns of one database
+
+    Integer columns get the smallest integer type that holds them, nullable
+    unless the pitchfx table declares them NOT NULL, so every frame and
+    chunk read from the database gets the same dtypes whatever its rows.
+    The categories of COMPACT_CATEGORIES are read from the pitchfx table
+    on first use and shared by all frames converted with the schema, so
+    frames and chunks can be concatenated without losing them. A schema
+    belongs to whoever created it and is freed with it.
+    """
+    def __init__(self, database):
+        """Initialize schema
+
+        Inputs:
+            database: sqlite3 connection to read the schema and categories from
+        """
+        self.database = database
+        notnull = dict((row[1], row[3]) for row in database.execute("PRAGMA table_info(pitchfx)"))
+        self.dtypes = {}
+        for name, dtype in COMPACT_DTYPES.items():
+            if dtype.startswith("int") and not notnull.get(name, 0):
+                dtype = dtype.capitalize()
+            self.dtypes[name] = dtype
+        # read on first use
+        self.categories = None
+
+    def category_lists(self):
+        """Grab the categories of COMPACT_CATEGORIES, read once"""
+        if self.categories is None:
+            self.categories = {}
+            for name in COMPACT_CATEGORIES:
+                rows = self.database.execute("SELECT DISTINCT %s FROM pitchfx WHERE %s IS NOT NULL ORDER BY %s" %(name, name, name)).fetchall()
+                self.categories[name] = [row[0] for row in rows]
+        return self.categories
+
+
+def compact_pitches(pitches, schema):
+    """Convert pitches to compact dtypes
+
+    Physics columns become float32, counts, innings and ids small integers
+    and pitch types, descriptions and outcomes categoricals, with the
+    dtypes and categories of a CompactSchema.
+
+    Inputs:
+        pitches: pandas dataframe of pitchfx columns
+        schema: CompactSchema of the database the pitches were read from
+
+    Outputs:
+        pitches: pandas dataframe with compact dtypes
+    """
+    for name, dtype in schema.dtypes.items():
+        if name not in pitches:
+            continue
+        try:
+            pitches[name] = pitches[name].astype(dtype)
+        except (ValueError, TypeError):
+            # text left in a numeric column
+            pass
+
+    # categories of the schema
+    categories = schema.category_lists()
+    for name in COMPACT_CATEGORIES:
+        if name not in pitches:
+            continue
+        # values added to the database after the categories were read
+        new = set(pitches[name].dropna().unique()).difference(categories[name])
+        if new:
+            categories[name] = categories[name] + sorted(new)
+        pitches[name] = pd.Categorical(pitches[name], categories=categories[name])
+    return pitches
+
+
+def read_chunks(query, database, params=(), chunksize=100000, records=False, compact=False, schema=None):
+    """Stream the result of a query in chunks of rows
+
+    Rows are stepped through with a cursor of the database, so only one
+    chunk is held in memory at a time, for queries over the whole league.
+
+    Inputs:
+        query: sql query
+        database: sqlite3 connection to read from
+        params [()]: parameters of the query
+        chunksize [100000]: number of rows per chunk
+        records [False]: yield numpy record arrays instead of dataframes
+        compact [False]: convert the columns with compact_pitches
+        schema [None]: CompactSchema of the database, None for one shared
+            by the chunks of this query only
+
+    Outputs:
+        chunks: generator of pandas dataframes or numpy record arrays
+    """
+    if compact and schema is None:
+        schema = CompactSchema(database)
+    cursor = database.execute(query, params)
+    try:
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            chunk = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            if compact:
+                chunk = compact_pitches(chunk, schema)
+            if records:
+                chunk = chunk.to_records(index=False)
+            yield chunk
+    finally:
+        cursor.close()
+
+
+class ResultCache():
+    """LRU cache of the frames of Player queries on one database
+
+    Frames are kept up to a total size in bytes and dropped when the data
+    of the database changes: the version of the ingest_version table is
+    bumped by every pitchfx_add that writes rows, and PRAGMA data_version
+    changes when another connection commits. Frames can also be pickled to
+    a directory, keyed by the database file and its ingest version, so
+    they survive restarts of the process. The files of earlier ingest
+    versions are deleted and the directory is kept under its own size
+    bound, dropping the least recently used files.
+    """
+    def __init__(self, database, max_bytes=256*2**20, directory=None, max_disk_bytes=2**30):
+        """Initialize cache
+
+        Inputs:
+            database: sqlite3 connection the cached queries run on
+            max_bytes [256 MB]: size bound of the frames kept in memory
+            directory [None]: directory of the on-disk tier, None for none
+            max_disk_bytes [1 GB]: size bound of the files of the database
+                in the on-disk tier
+        """
+        self.database = database
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.frames = collections.OrderedDict()
+        self.nbytes = 0
+        self.token = None
+        self.path = database.execute("PRAGMA database_list").fetchone()[2]
+        # prefix of the files of the database in the on-disk tier
+        self.prefix = hashlib.sha1(repr(self.path).encode("utf-8")).hexdigest()[:16]
+
+    def version(self):
+        """Grab the ingest version and data version of the database"""
+        try:
+            version = self.database.execute("SELECT version FROM ingest_version").fetchone()[0]
+        except sqlite3.OperationalError:
+            # database created before ingest_version
+            version = 0
+        data_version = self.database.execute("PRAGMA data_version").fetchone()[0]
+        return version, data_version
+
+    def check(self):
+        """Drop the frames in memory if the database changed
+
+        Files of other ingest versions are deleted from the on-disk tier.
+        """
+        token = self.version()
+        if token != self.token:
+            self.clear()
+            ingested = self.token is None or token[0] != self.token[0]
+            self.token = token
+            if self.directory is not None and ingested:
+                self.prune()
+
+    def clear(self):
+        """Drop the frames in memory"""
+        self.frames.clear()
+        self.nbytes = 0
+
+    def disk_path(self, key):
+        """Grab the file of a key in the on-disk tier"""
+        name = hashlib.sha1(repr((self.path, self.token[0], key)).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "%s-%d-%s.pkl" %(self.prefix, self.token[0], name))
+
+    def prune(self):
+        """Delete the files of the database from earlier ingest versions and
+        the least recently used ones over max_disk_bytes"""
+        current = "%s-%d-" %(self.prefix, self.token[0])
+        files = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith(self.prefix+"-") and name.endswith(".pkl")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if not name.startswith(current):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+            except OSError:
+                # removed by another process
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def get(self, key):
+        """Grab a copy of the frame of a key, None if it is not cached"""
+        self.check()
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return self.frames[key][0].copy()
+        if self.directory is not None:
+            path = self.disk_path(key)
+            try:
+                frame = pd.read_pickle(path)
+                # recently used files are pruned last
+                os.utime(path, None)
+            except (IOError, OSError):
+                return None
+            self.keep(key, frame)
+            return frame.copy()
+        return None
+
+    def put(self, key, frame):
+        """Cache a copy of the frame of a key"""
+        self.check()
+        frame = frame.copy()
+        if self.directory is not None:
+            # write to a temporary file first so readers never see partial files
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(fd)
+            frame.to_pickle(tmp)
+            os.replace(tmp, self.disk_path(key))
+            self.prune()
+        self.keep(key, frame)
+
+    def keep(self, key, frame):
+        """Keep a frame in memory, dropping the least recently used ones"""
+        nbytes = int(frame.memory_usage(deep=True).sum())
+        if key in self.frames:
+            self.nbytes -= self.frames.pop(key)[1]
+        if nbytes > self.max_bytes:
+            return
+        self.frames[key] = (frame, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            self.nbytes -= self.frames.popitem(last=False)[1][1]
+
 
 class Player():
     """Player class for extracting information from pitchfx database"""
-    def __init__(self, name, database):
+    def __init__(self, name, database, cache=None, retain=True, schema=None):
         """Initialize player object
         
         Inputs:
             name: name of player in "first last" format
             database: database to read from
+            cache [None]: ResultCache of the database to share results
+            retain [True]: keep the last result of each method on the
+                player (player_pfx, player_hevents, ...), False for players
+                held by long-lived services
+            schema [None]: CompactSchema of the database to share between
+                players, None for one made by the player when needed
         """
         # parse name
         self.first, self.last = name.split(" ")
         self.database = database
+        self.cache = cache
+        self.retain = retain
+        self.schema = schema
+        # resolved on first query
+        self.ids = None
+
+    @classmethod
+    def from_id(cls, player_id, database, cache=None, retain=True, schema=None):
+        """Initialize player object from a player id
+
+        Skips resolving the name, for jobs over many players.
+
+        Inputs:
+            player_id: player id, or list of ids of the same player
+            database: database to read from
+            cache [None]: ResultCache of the database to share results
+            retain [True]: keep the last result of each method on the player
+            schema [None]: CompactSchema of the database to share between players
+        """
+        player = cls.__new__(cls)
+        player.first, player.last = None, None
+        player.database = database
+        player.cache = cache
+        player.retain = retain
+        player.schema = schema
+        if isinstance(player_id, (list, tuple)):
+            player.ids = [int(pid) for pid in player_id]
+        else:
+            player.ids = [int(player_id)]
+        return player
+
+    def compact_schema(self):
+        """Grab the CompactSchema of the player, made once"""
+        if self.schema is None:
+            self.schema = CompactSchema(self.database)
+        return self.schema
+
+    def player_ids(self):
+        """Grab the player ids of the name, looked up once"""
+        if self.ids is None:
+            ids = pd.read_sql_query(PLAYER_IDS, self.database, params=(self.first, self.last))
+            self.ids = [int(pid) for pid in ids.player_id]
+        return self.ids
+
+    def retained(self, name, frame):
+        """Keep a result on the player if it retains results"""
+        if self.retain:
+            setattr(self, name, frame)
+        return frame
+
+    def read_query(self, query, fields=None, args=(), chunksize=None, records=False, compact=False):
+        """Run a player query with the player ids bound to its placeholders
+
+        Inputs:
+            query: player query
+            fields: other fields to format the query with
+            args: parameters bound after the player ids
+            chunksize [None]: stream chunks of rows with read_chunks
+            records [False]: stream numpy record arrays
+            compact [False]: convert the pitches with compact_pitches
+        """
+        ids = self.player_ids()
+        fields = dict(fields or {}, ids=", ".join("?"*len(ids)))
+        if chunksize:
+            schema = self.compact_schema() if compact else None
+            return read_chunks(query %fields, self.database, ids+list(args), chunksize, records, compact, schema)
+
+        # cached result of the same query and parameters
+        if self.cache is not None:
+            key = (query %fields, tuple(ids+list(args)), compact)
+            frame = self.cache.get(key)
+            if frame is not None:
+                return frame
+        frame = pd.read_sql_query(query %fields, self.database, params=ids+list(args))
+        if compact:
+            frame = compact_pitches(frame, self.compact_schema())
+        if self.cache is not None:
+            self.cache.put(key, frame)
+        return frame
         
     def info(self):
         """Grab player information"""
         # grab player info
-        query = """SELECT *
-                   FROM players
-                   WHERE player_first='%s'
-                       AND player_last='%s'""" %(self.first, self.last)
-        self.player_info = pd.read_sql_query(query, self.database)
+        player_info = self.read_query(INFO)
         
         # clean up
-        return self.player_info
+        return self.retained("player_info", player_info)
         
     def pitch_games(self):
         """Grab all games from database player pitched in"""
         # grab all games
-        query = """SELECT DISTINCT games.*
-                FROM games
-                JOIN events ON (games.game_id=events.game_id)
-                WHERE events.pitcher_id=(SELECT player_id
-                FROM players
-                WHERE players.player_first='%s'
-                    AND players.player_last='%s')
-                ORDER BY games.game_id""" %(self.first, self.last)
-        self.player_pgames = pd.read_sql_query(query, self.database)
+        player_pgames = self.read_query(PITCH_GAMES)
         
         # clean up
-        return self.player_pgames
+        return self.retained("player_pgames", player_pgames)
     
     def hit_games(self):
         """Grab all games from database player hit in"""
         # grab all games
-        query = """SELECT DISTINCT games.*
-                FROM games
-                JOIN events ON (games.game_id=events.game_id)
-                WHERE events.batter_id=(SELECT player_id
-                FROM players
-                WHERE players.player_first='%s'
-                    AND players.player_last='%s')
-                ORDER BY games.game_id""" %(self.first, self.last)
-        self.player_hgames = pd.read_sql_query(query, self.database)
+        player_hgames = self.read_query(HIT_GAMES)
         
         # clean up
-        return self.player_hgames
+        return self.retained("player_hgames", player_hgames)
 
     def pitches(self, **params):
         """Grab all pitches from database thrown by player
+
+        The options are compiled into the query, so only the requested
+        rows and columns are read.
         
         Inputs:
+            columns [all]: list of pitchfx columns to return
+            start [None]: first date (yyyymmdd)
+            end [None]: last date (yyyymmdd)
+            game_types [None]: list of game types (R, F, D, L, W)
+            pitch_types [None]: list of pitch types
+            balls [None]: balls in the count before the pitch
+            strikes [None]: strikes in the count before the pitch
             clean [False]: remove Nans, pitch-outs, intentional balls
+            chunksize [None]: return a generator of chunks of this many
+                pitches instead of reading them all
+            records [False]: chunks are numpy record arrays
+            compact [False]: float32, small integer and categorical columns
+                (see compact_pitches)
         
         Outputs:
             pitches: pandas dataframe containing pitchfx data
         """
+        # stream chunks
+        fields, args = pitch_fields(params)
+        compact = bool(params.get("compact", False))
+        if params.get("chunksize"):
+            return self.read_query(PITCHES, fields, args, params["chunksize"], params.get("records", False), compact)
+
         # grab all pitches
-        query = """SELECT DISTINCT pitchfx.* 
-                FROM pitchfx
-                JOIN events ON (pitchfx.game_id=events.game_id
-                    AND pitchfx.cur_event=events.event_id)
-                WHERE events.pitcher_id=(SELECT player_id
-                FROM players
-                WHERE players.player_first='%s'
-                    AND players.player_last='%s')
-                ORDER BY game_id, pitch_num""" %(self.first, self.last)
-        self.player_pfx = pd.read_sql_query(query, self.database)
-        
-        # clean or not
-        if params:
-            if "clean" in params:
-                if bool(params["clean"]):
-                    self.player_pfx = self.player_pfx.dropna(axis=0, how="any")
-                    self.player_pfx = self.player_pfx[self.player_pfx.pitch_type!="IN"]
-                    self.player_pfx = self.player_pfx[self.player_pfx.pitch_type!="PO"]
+        player_pfx = self.read_query(PITCHES, fields, args, compact=compact)
         
         # clean up
-        return self.player_pfx
+        return self.retained("player_pfx", player_pfx)
     
     def pitches_against(self, **params):
         """Grab all pitches from database thrown against player
+
+        The options are compiled into the query, so only the requested
+        rows and columns are read.
         
         Inputs:
+            columns [all]: list of pitchfx columns to return
+            start [None]: first date (yyyymmdd)
+            end [None]: last date (yyyymmdd)
+            game_types [None]: list of game types (R, F, D, L, W)
+            pitch_types [None]: list of pitch types
+            balls [None]: balls in the count before the pitch
+            strikes [None]: strikes in the count before the pitch
             clean [False]: remove Nans, pitch-outs, intentional balls
+            chunksize [None]: return a generator of chunks of this many
+                pitches instead of reading them all
+            records [False]: chunks are numpy record arrays
+            compact [False]: float32, small integer and categorical columns
+                (see compact_pitches)
         
         Outputs:
             pitches: pandas dataframe containing pitchfx data
         """
+        # stream chunks
+        fields, args = pitch_fields(params)
+        compact = bool(params.get("compact", False))
+        if params.get("chunksize"):
+            return self.read_query(PITCHES_AGAINST, fields, args, params["chunksize"], params.get("records", False), compact)
+
         # grab all pitches
-        query = """SELECT DISTINCT pitchfx.* 
-                FROM pitchfx
-                JOIN events ON (pitchfx.game_id=events.game_id
-                    AND pitchfx.cur_event=events.event_id)
-                WHERE events.batter_id=(SELECT player_id
-                FROM players
-                WHERE players.player_first='%s'
-                    AND players.player_last='%s')
-                ORDER BY game_id, pitch_num""" %(self.first, self.last)
-        self.player_hfx = pd.read_sql_query(query, self.database)
-        
-        # clean or not
-        if params:
-            if "clean" in params:
-                if bool(params["clean"]):
-                    self.player_hfx = self.player_hfx.dropna(axis=0, how="any")
-                    self.player_hfx = self.player_hfx[self.player_hfx.pitch_type!="IN"]
-                    self.player_hfx = self.player_hfx[self.player_hfx.pitch_type!="PO"]
+        player_hfx = self.read_query(PITCHES_AGAINST, fields, args, compact=compact)
         
         # clean up
-        return self.player_hfx
+        return self.retained("player_hfx", player_hfx)
     
     def pitch_events(self):
         """Grab events where player is the pitcher"""
         # grab all events
-        query = """SELECT DISTINCT * 
-                FROM events
-                WHERE pitcher_id=(SELECT player_id
-                FROM players
-                WHERE players.player_first='%s'
-                    AND players.player_last='%s')
-                ORDER BY game_id, event_id""" %(self.first, self.last)
-        self.player_pevents = pd.read_sql_query(query, self.database)
+        player_pevents = self.read_query(PITCH_EVENTS)
         
         # clean up
-        return self.player_pevents
+        return self.retained("player_pevents", player_pevents)
     
     def hit_events(self):
         """Grab events where player is the batter"""
         # grab all events
-        query = """SELECT DISTINCT * 
-                FROM events
-                WHERE batter_id=(SELECT player_id
-                FROM players
-                WHERE players.player_first='%s'
-                    AND players.player_last='%s')
-                ORDER BY game_id, event_id""" %(self.first, self.last)
-        self.player_hevents = pd.read_sql_query(query, self.database)
+        player_hevents = self.read_query(HIT_EVENTS)
         
         # clean up
-        return self.player_hevents
\ No newline at end of file
+        return self.retained("player_hevents", player_hevents)
+
+    def query_plans(self):
+        """Describe how sqlite runs the queries of the player
+
+        Shows whether the queries use the indexes of the database or scan
+        whole tables (see index_init in load_pitchfx_mod).
+
+        Outputs:
+            plans: pandas dataframe of the EXPLAIN QUERY PLAN details of
+                each query
+        """
+        fields, args = pitch_fields({})
+        plans = []
+        for name, query in QUERIES:
+            plan = self.read_query("EXPLAIN QUERY PLAN "+query, fields)
+            plan.insert(0, "query", name)
+            plans.append(plan)
+        return pd.concat(plans, ignore_index=True)
+
+
+class Players():
+    """Batch of players read from pitchfx database in one query per table
+
+    Each method joins the tables to a temporary table of the player ids
+    and returns a dictionary of the frames of each player id, with the
+    same rows as the method of Player.from_id.
+    """
+    def __init__(self, player_ids, database, schema=None):
+        """Initialize batch of players
+
+        Inputs:
+            player_ids: list of player ids
+            database: sqlite3 connection to read from
+            schema [None]: CompactSchema of the database, None for one made
+                by the batch when needed
+        """
+        self.ids = sorted(set(int(pid) for pid in player_ids))
+        self.database = database
+        self.schema = schema
+
+    def read_batch(self, query, fields=None, args=(), compact=False):
+        """Run a batch query and split its rows by player id
+
+        Inputs:
+            query: batch query
+            fields: fields to format the query with
+            args: parameters of the query
+            compact [False]: convert the pitches with compact_pitches
+        """
+        # fill the temporary table of this connection with the ids, inside a
+        # savepoint so a transaction of the caller is neither committed nor
+        # left with the ids (read with a cursor, since pandas rolls back the
+        # connection when a query fails)
+        self.database.execute("SAVEPOINT batch_players")
+        try:
+            self.database.execute(BATCH_TABLE)
+            self.database.execute("DELETE FROM batch_players")
+            self.database.executemany("INSERT INTO batch_players VALUES (?)", [(pid,) for pid in self.ids])
+            cursor = self.database.execute(query %(fields or {}), list(args))
+            columns = [column[0] for column in cursor.description]
+            frame = pd.DataFrame.from_records(cursor.fetchall(), columns=columns, coerce_float=True)
+        except Exception:
+            self.database.execute("ROLLBACK TO SAVEPOINT batch_players")
+            self.database.execute("RELEASE SAVEPOINT batch_players")
+            raise
+        self.database.execute("DELETE FROM batch_players")
+        self.database.execute("RELEASE SAVEPOINT batch_players")
+        if compact:
+            if self.schema is None:
+                self.schema = CompactSchema(self.database)
+            frame = compact_pitches(frame, self.schema)
+
+        # split by player
+        frames = {}
+        groups = dict(list(frame.groupby("batch_id", sort=False)))
+        frame = frame.drop(columns="batch_id")
+        for pid in self.ids:
+            if pid in groups:
+                frames[pid] = groups[pid].drop(columns="batch_id").reset_index(drop=True)
+            else:
+                frames[pid] = frame.iloc[0:0]
+        return frames
+
+    def info(self):
+        """Grab player information of each player"""
+        return self.read_batch(BATCH_INFO)
+
+    def pitch_games(self):
+        """Grab all games each player pitched in"""
+        return self.read_batch(BATCH_PITCH_GAMES)
+
+    def hit_games(self):
+        """Grab all games each player hit in"""
+        return self.read_batch(BATCH_HIT_GAMES)
+
+    def pitches(self, **params):
+        """Grab all pitches thrown by each player
+
+        Inputs:
+            same options as Player.pitches
+        """
+        fields, args = pitch_fields(params)
+        return self.read_batch(BATCH_PITCHES, fields, args, bool(params.get("compact", False)))
+
+    def pitches_against(self, **params):
+        """Grab all pitches thrown against each player
+
+        Inputs:
+            same options as Player.pitches
+        """
+        fields, args = pitch_fields(params)
+        return self.read_batch(BATCH_PITCHES_AGAINST, fields, args, bool(params.get("compact", False)))
+
+    def pitch_events(self):
+        """Grab events where each player is the pitcher"""
+        return self.read_batch(BATCH_PITCH_EVENTS)
+
+    def hit_events(self):
+        """Grab events where each player is the batter"""
+        return self.read_batch(BATCH_HIT_EVENTS)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+#----------------------------------------------------
+# classify_pitches.py
+#
+# python code to cluster the pitches of every pitcher
+# in a pitchfx sql database into pitch types
+#----------------------------------------------------
+
+
+#----------------------------------------------------
+# imports and aliases
+#----------------------------------------------------
+import sys
+import os
+import getopt
+import classify_pitches_mod as cm
+
+
+#----------------------------------------------------
+# kernel
+#----------------------------------------------------
+if __name__ == "__main__":
+    # grab options
+    longopts = ["processes=", "min-pitches="]
+    try:
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "", longopts)
+    except getopt.GetoptError:
+        opts, args = [], []
+    processes = 1
+    min_pitches = cm.MIN_PITCHES
+    for opt, val in opts:
+        if opt == "--processes":
+            processes = max(int(val), 1)
+        elif opt == "--min-pitches":
+            min_pitches = max(int(val), 1)
+
+    # check number of arguments
+    if len(args) < 1:
+        print("Usage:")
+        print("    %s [name of db] [--processes N] [--min-pitches N]" %(sys.argv[0]))
+        print(" --processes: number of clustering processes (default 1)")
+        print(" --min-pitches: fewest clean pitches to cluster a pitcher (default %d)" %(cm.MIN_PITCHES))
+        print(" pitchers already clustered are skipped until their pitch count changes")
+        sys.exit()
+
+    # grab variables
+    dbname = args[0]
+    if os.path.isfile(dbname) is False:
+        print("Database %s does not exist" %(dbname))
+        sys.exit()
+
+    # cluster the pitchers whose pitch count changed
+    counts = cm.classify_pitchers(dbname, processes, min_pitches)
+    print("clustered %(clustered)d pitchers, %(empty)d without clusters, %(failed)d failed" %counts)
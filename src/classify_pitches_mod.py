@@ -0,0 +1,256 @@
+# imports
+import functools
+import multiprocessing
+import sqlite3
+import numpy as np
+from DBSCANKMeans import DBSCANKMeans
+from Player import Player
+
+# trajectory features clustered into pitch types
+CLUSTER_FEATURES = ["ax", "az", "start_speed"]
+
+# pitchers with fewer clean pitches are not clustered
+MIN_PITCHES = 100
+
+# cluster of each clean pitch, by pitch
+CLUSTERS_TABLE = """CREATE TABLE IF NOT EXISTS pitch_clusters (
+        game_id INTEGER,
+        pitch_num INTEGER,
+        cluster_id INTEGER,
+        UNIQUE(game_id, pitch_num))"""
+
+# K-means centroid of each cluster of a pitcher, in the units of the features
+CENTROIDS_TABLE = """CREATE TABLE IF NOT EXISTS pitch_centroids (
+        pitcher_id INTEGER,
+        cluster_id INTEGER,
+        n_pitches INTEGER,
+        %(features)s,
+        UNIQUE(pitcher_id, cluster_id))"""
+
+# standardization of the features of each clustered pitcher
+STANDARDS_TABLE = """CREATE TABLE IF NOT EXISTS pitch_standards (
+        pitcher_id INTEGER,
+        feature TEXT,
+        mean REAL,
+        std REAL,
+        UNIQUE(pitcher_id, feature))"""
+
+# pitch count of each pitcher when it was last clustered
+RUNS_TABLE = """CREATE TABLE IF NOT EXISTS pitch_cluster_runs (
+        pitcher_id INTEGER,
+        n_pitches INTEGER,
+        UNIQUE(pitcher_id))"""
+
+# pitchers whose pitch count changed since they were last clustered
+CLUSTER_PLAN = """SELECT counts.pitcher_id, counts.n_pitches
+        FROM (SELECT pitcher_id, COUNT(*) AS n_pitches
+            FROM pitchfx
+            WHERE pitcher_id IS NOT NULL
+            GROUP BY pitcher_id) AS counts
+        LEFT JOIN pitch_cluster_runs AS runs
+            ON runs.pitcher_id=counts.pitcher_id
+        WHERE runs.n_pitches IS NULL
+            OR runs.n_pitches!=counts.n_pitches
+        ORDER BY counts.pitcher_id"""
+
+# results of a pitcher, replaced on every run
+DELETE_CLUSTERS = """DELETE FROM pitch_clusters
+        WHERE (game_id, pitch_num) IN (SELECT game_id, pitch_num
+            FROM pitchfx
+            WHERE pitcher_id=?)"""
+
+DELETE_CENTROIDS = """DELETE FROM pitch_centroids
+        WHERE pitcher_id=?"""
+
+DELETE_STANDARDS = """DELETE FROM pitch_standards
+        WHERE pitcher_id=?"""
+
+# fitted model of a pitcher
+PITCHER_CENTROIDS = """SELECT cluster_id, %(features)s
+        FROM pitch_centroids
+        WHERE pitcher_id=?
+        ORDER BY cluster_id"""
+
+PITCHER_STANDARDS = """SELECT feature, mean, std
+        FROM pitch_standards
+        WHERE pitcher_id=?"""
+
+# database connection of a worker process
+WORKER = {}
+
+
+def cluster_init(db):
+    """Create the pitch cluster tables
+
+    Inputs:
+        db: sqlite3 connection
+    """
+    columns = [row[1] for row in db.execute("PRAGMA table_info(pitchfx)")]
+    if "pitcher_id" not in columns:
+        raise ValueError("pitchfx has no pitcher_id column, run index_pitchfx.py on the database first")
+    db.execute(CLUSTERS_TABLE)
+    db.execute(CENTROIDS_TABLE %{"features": ", ".join("%s REAL" %(name) for name in CLUSTER_FEATURES)})
+    db.execute(STANDARDS_TABLE)
+    db.execute(RUNS_TABLE)
+    db.commit()
+
+
+def cluster_plan(db):
+    """Grab the pitchers to cluster
+
+    Inputs:
+        db: sqlite3 connection
+
+    Outputs:
+        plan: list of (pitcher_id, n_pitches) of the pitchers never
+              clustered or whose pitch count changed since
+    """
+    return [tuple(row) for row in db.execute(CLUSTER_PLAN)]
+
+
+def worker_init(dbname):
+    """Open the database in a worker process"""
+    WORKER["db"] = sqlite3.connect(dbname)
+
+
+def classify_pitcher(job, min_pitches=MIN_PITCHES, q=80):
+    """Cluster the clean pitches of a pitcher
+
+    Inputs:
+        job: (pitcher_id, n_pitches) from cluster_plan
+        min_pitches: fewest clean pitches to cluster
+        q: quantile (percent) of the eps estimate of DBSCANKMeans
+
+    Outputs:
+        pitcher_id: pitcher id
+        n_pitches: pitch count of the pitcher in the plan
+        clusters: list of (game_id, pitch_num, cluster_id), None if
+                  clustering failed
+        centroids: list of (pitcher_id, cluster_id, n_pitches, features...)
+        standards: list of (pitcher_id, feature, mean, std)
+    """
+    pitcher_id, n_pitches = job
+    pitches = Player.from_id(pitcher_id, WORKER["db"], retain=False).pitches(
+        columns=["game_id", "pitch_num"]+CLUSTER_FEATURES, clean=1)
+    if pitches.shape[0] < min_pitches:
+        return pitcher_id, n_pitches, [], [], []
+
+    # cluster the features, labels of -1 are left unclustered
+    dbk = DBSCANKMeans(q=q)
+    try:
+        labels = dbk.fit_predict(pitches[CLUSTER_FEATURES], stand=True)
+    except ValueError:
+        return pitcher_id, n_pitches, None, [], []
+    clustered = labels >= 0
+    clusters = list(zip(pitches.game_id[clustered].tolist(),
+                        pitches.pitch_num[clustered].tolist(),
+                        labels[clustered].tolist()))
+
+    # centroids in the units of the features and the standardization
+    sizes = np.bincount(labels[clustered], minlength=dbk.k)
+    centroids = dbk.centroids*dbk.stds+dbk.means
+    centroids = [(pitcher_id, cluster_id, int(sizes[cluster_id]))+tuple(centroids.loc[cluster_id].tolist())
+                 for cluster_id in range(dbk.k)]
+    standards = [(pitcher_id, feature, float(dbk.means[feature]), float(dbk.stds[feature]))
+                 for feature in CLUSTER_FEATURES]
+
+    # clean up
+    return pitcher_id, n_pitches, clusters, centroids, standards
+
+
+def cluster_write(db, pitcher_id, n_pitches, clusters, centroids, standards):
+    """Replace the clusters, centroids and standardization of a pitcher
+
+    Inputs:
+        db: sqlite3 connection
+        pitcher_id: pitcher id
+        n_pitches: pitch count of the pitcher when it was clustered
+        clusters: list of (game_id, pitch_num, cluster_id)
+        centroids: list of (pitcher_id, cluster_id, n_pitches, features...)
+        standards: list of (pitcher_id, feature, mean, std)
+    """
+    db.execute(DELETE_CLUSTERS, (pitcher_id,))
+    db.execute(DELETE_CENTROIDS, (pitcher_id,))
+    db.execute(DELETE_STANDARDS, (pitcher_id,))
+    db.executemany("INSERT OR REPLACE INTO pitch_clusters VALUES (?, ?, ?)", clusters)
+    db.executemany("INSERT INTO pitch_centroids VALUES (%s)" %(", ".join("?"*(3+len(CLUSTER_FEATURES)))), centroids)
+    db.executemany("INSERT INTO pitch_standards VALUES (?, ?, ?, ?)", standards)
+    db.execute("INSERT OR REPLACE INTO pitch_cluster_runs VALUES (?, ?)", (pitcher_id, n_pitches))
+    db.commit()
+
+
+def classify_pitchers(dbname, processes=1, min_pitches=MIN_PITCHES, q=80):
+    """Cluster the pitches of every pitcher whose pitch count changed
+
+    Pitchers are clustered on a pool of processes, each reading from its
+    own connection, while the results are written from the calling
+    process only.
+
+    Inputs:
+        dbname: name of the database
+        processes: number of clustering processes, 1 to cluster in the
+                   calling process
+        min_pitches: fewest clean pitches to cluster
+        q: quantile (percent) of the eps estimate of DBSCANKMeans
+
+    Outputs:
+        counts: number of pitchers clustered, left without clusters (too
+                few pitches or no dbscan cluster) and failed
+    """
+    db = sqlite3.connect(dbname)
+    cluster_init(db)
+    plan = cluster_plan(db)
+    classify = functools.partial(classify_pitcher, min_pitches=min_pitches, q=q)
+    counts = {"clustered": 0, "empty": 0, "failed": 0}
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, worker_init, (dbname,))
+        results = pool.imap_unordered(classify, plan)
+    else:
+        pool = None
+        worker_init(dbname)
+        results = map(classify, plan)
+    try:
+        for pitcher_id, n_pitches, clusters, centroids, standards in results:
+            # failed pitchers stay in the plan of the next run
+            if clusters is None:
+                counts["failed"] += 1
+                continue
+            cluster_write(db, pitcher_id, n_pitches, clusters, centroids, standards)
+            counts["clustered" if clusters else "empty"] += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if "db" in WORKER:
+            WORKER.pop("db").close()
+        db.close()
+
+    # clean up
+    return counts
+
+
+def pitcher_model(db, pitcher_id):
+    """Load the fitted model of a pitcher to label new pitches
+
+    Inputs:
+        db: sqlite3 connection
+        pitcher_id: pitcher id
+
+    Outputs:
+        dbk: DBSCANKMeans whose predict labels pitches with the clusters
+             in pitch_clusters, None if the pitcher was never clustered
+    """
+    standards = db.execute(PITCHER_STANDARDS, (pitcher_id,)).fetchall()
+    if not standards:
+        return None
+    standards = dict((feature, (mean, std)) for feature, mean, std in standards)
+    means = np.array([standards[feature][0] for feature in CLUSTER_FEATURES])
+    stds = np.array([standards[feature][1] for feature in CLUSTER_FEATURES])
+
+    # centroids back in standardized units
+    rows = db.execute(PITCHER_CENTROIDS %{"features": ", ".join(CLUSTER_FEATURES)}, (pitcher_id,)).fetchall()
+    centroids = [((np.array(row[1:])-means)/stds).tolist() for row in rows]
+    return DBSCANKMeans.from_model({"features": CLUSTER_FEATURES,
+                                    "means": means.tolist(),
+                                    "stds": stds.tolist(),
+                                    "centroids": centroids,})
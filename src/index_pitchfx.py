@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#----------------------------------------------------
+# index_pitchfx.py
+#
+# python code to upgrade the schema of an existing
+# pitchfx sql database, build its indexes and
+# verify them, printing the query plans of the
+# Player queries before and after
+#----------------------------------------------------
+
+
+#----------------------------------------------------
+# imports and aliases
+#----------------------------------------------------
+import sys
+import os
+import sqlite3
+import load_pitchfx_mod as pm
+import player_queries as pq
+
+
+#----------------------------------------------------
+# functions
+#----------------------------------------------------
+def print_plans(hdb, title):
+    """Print the query plan of the name lookup and of each Player query
+
+    Args:
+        hdb: sqlite3 database handle
+        title: heading of the plans
+    """
+    print "query plans %s:" %(title)
+    plans = [('player_ids', pq.PLAYER_IDS, ("first", "last"))]
+    for name, query in pq.QUERIES:
+        # a single dummy player id
+        plans.append((name, query %dict(pq.PITCH_FIELDS, ids="?"), (0,)))
+    for name, query, args in plans:
+        for detail in pm.query_plan(hdb, query, args):
+            print "    %-16s %s" %(name, detail)
+
+
+#----------------------------------------------------
+# kernel
+#----------------------------------------------------
+# check number of arguments
+if len(sys.argv) < 2:
+    print "Usage:"
+    print "    %s [name of db]" %(sys.argv[0])
+    sys.exit()
+
+# grab variables
+dbname = sys.argv[1]
+if os.path.isfile(dbname) is False:
+    print "Database %s does not exist" %(dbname)
+    sys.exit()
+db = sqlite3.connect(dbname)
+hdb = db.cursor()
+
+# bookkeeping tables and the event columns of the pitchfx table
+pm.manifest_init(hdb)
+if pm.pitchfx_migrate(hdb):
+    print "added event columns to pitchfx"
+
+# build missing indexes and update the query planner statistics
+print_plans(hdb, "before indexing")
+for name in pm.index_init(hdb):
+    print "built %s" %(name)
+hdb.execute("ANALYZE")
+db.commit()
+print_plans(hdb, "after indexing")
+
+# verify
+missing = pm.index_check(hdb)
+if missing:
+    print "missing indexes: %s" %(", ".join(missing))
+else:
+    print "all indexes present"
+
+# clean up
+hdb.close()
+db.close()
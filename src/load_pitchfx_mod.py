@@ -12,10 +12,141 @@
 # imports and aliases
 #----------------------------------------------
 import xml.etree.ElementTree as ET
+import xml.parsers.expat as expat
+import ElementTree as VET
+from multiprocessing.pool import ThreadPool
+import multiprocessing
+import collections
+import functools
+import datetime
+import tempfile
+import sqlite3
 import urllib
+import gzip
+import os
 import re
 
 
+#----------------------------------------------
+# definitions
+#----------------------------------------------
+# root url of the gameday directory tree
+GD2_ROOT = "http://gd2.mlb.com/components/game/mlb"
+
+# game types
+GTYPES = ['R', 'F', 'D', 'L', 'W']
+
+# days of the year (mmdd) that can have games of the game types, used for
+# seasons not in the season index
+SEASON_WINDOW = (301, 1115)
+
+# pitchfx variables: sqlite3 database indices
+PFXKEYS = {
+    'game_id': 0,
+    'id': 1,
+    'at_bat': 2,
+    'time': 3,
+    'cur_event': 4,
+    'des': 5,
+    'type': 6,
+    'pre_balls': 7,
+    'post_balls': 8,
+    'pre_strikes': 9,
+    'post_strikes': 10,
+    'start_speed': 11,
+    'end_speed': 12,
+    'sz_top': 13,
+    'sz_bot': 14,
+    'pfx_x': 15,
+    'pfx_z': 16,
+    'px': 17,
+    'pz': 18,
+    'x': 19,
+    'y': 20,
+    'x0': 21,
+    'y0': 22,
+    'z0': 23,
+    'vx0': 24,
+    'vy0': 25,
+    'vz0': 26,
+    'ax': 27,
+    'ay': 28,
+    'az': 29,
+    'break_y': 30,
+    'break_angle': 31,
+    'break_length': 32,
+    'spin_dir': 33,
+    'spin_rate': 34,
+    'pitch_type': 35
+    }
+
+# columns of the event of each pitch copied onto the pitchfx table, so
+# pitches are found without joining events: pitchfx column, declared type
+# and index in the events table
+PFX_EVENT = [
+    ('pitcher_id', 'INTEGER', 7),
+    ('batter_id', 'INTEGER', 8),
+    ('inning', 'INTEGER', 3),
+    ('is_top_inning', 'INTEGER', 4),
+    ('pre_out', 'INTEGER', 5),
+    ('pre_1b', 'INTEGER', 9),
+    ('pre_2b', 'INTEGER', 11),
+    ('pre_3b', 'INTEGER', 13),
+    ]
+
+# insert statements of the rows buffered by PitchfxWriter
+INSERTS = [
+    ('teams', "INSERT OR IGNORE INTO teams VALUES (?, ?, ?)"),
+    ('stadiums', "INSERT OR IGNORE INTO stadiums VALUES (?, ?)"),
+    ('umpires', "INSERT OR IGNORE INTO umpires VALUES (?, ?)"),
+    ('players', "INSERT OR IGNORE INTO players VALUES " \
+        "(?, ?, ?, ?, ?, ?, ?)"),
+    ('games', "INSERT OR IGNORE INTO games VALUES " \
+        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"),
+    ('events', "INSERT OR REPLACE INTO events VALUES (" \
+        "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
+        "?, ?, ?, ?, ?, ?, ?, ?, ?, ?" \
+        ")"),
+    ('pitchfx', "INSERT OR IGNORE INTO pitchfx VALUES (" \
+        "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
+        "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
+        "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
+        "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
+        "?, ?, ?, ?" \
+        ")"),
+    ('ingest_manifest', "INSERT OR REPLACE INTO ingest_manifest VALUES " \
+        "(?, ?, ?, ?)"),
+    ]
+
+# unique indexes of the large tables, dropped during bulk loads: name,
+# table, columns and the row kept of duplicates (the last one for the
+# INSERT OR REPLACE of events, the first one for INSERT OR IGNORE)
+UNIQUE_INDEXES = [
+    ('events_game_event', 'events', '(game_id, event_id)', 'max'),
+    ('pitchfx_game_pitch', 'pitchfx', '(game_id, pitch_num)', 'min'),
+    ]
+
+# secondary indexes of the Player queries: name, table and columns
+INDEXES = [
+    ('events_pitcher', 'events', '(pitcher_id)'),
+    ('events_batter', 'events', '(batter_id)'),
+    ('pitchfx_pitcher', 'pitchfx', '(pitcher_id, game_id, pitch_num)'),
+    ('pitchfx_batter', 'pitchfx', '(batter_id, game_id, pitch_num)'),
+    ('players_name', 'players', '(player_last, player_first)'),
+    ('games_date', 'games', '(date)'),
+    ]
+
+# ingest manifest status of games that need no further work
+MANIFEST_DONE = ['committed', 'skipped']
+
+# parse_game result of a game whose streamed inning_all.xml could not be
+# read, written as pending like a game that failed to download
+STREAM_FAILED = 'stream failed'
+
+# regular expression for game directories in a day listing
+STR_GAME = re.compile("""^.+href="(gid_\d+_\d+_\d+_.+)/".+$""")
+
+
 #----------------------------------------------
 # begin definitions
 #----------------------------------------------
@@ -111,8 +242,7 @@ def pitchfx_init(hdb):
         "pre_home_score INTEGER, " \
         "post_home_score INTEGER, " \
         "pre_away_score INTEGER, " \
-        "post_away_score INTEGER, " \
-        "UNIQUE(game_id, event_id)" \
+        "post_away_score INTEGER" \
         ")"
     hdb.execute(comm)
 
@@ -154,15 +284,1168 @@ def pitchfx_init(hdb):
         "spin_dir REAL, " \
         "spin_rate REAL, " \
         "pitch_type TEXT, " \
-        "UNIQUE(game_id, pitch_num)" \
+        "pitcher_id INTEGER, " \
+        "batter_id INTEGER, " \
+        "inning INTEGER, " \
+        "is_top_inning INTEGER, " \
+        "pre_out INTEGER, " \
+        "pre_1b INTEGER, " \
+        "pre_2b INTEGER, " \
+        "pre_3b INTEGER" \
+        ")"
+    hdb.execute(comm)
+    index_init(hdb)
+
+    # ingest bookkeeping
+    manifest_init(hdb)
+
+
+def pitchfx_migrate(hdb):
+    """Add the event columns of PFX_EVENT to an existing pitchfx table
+
+    Databases created before the columns were added get them filled in
+    from the events table, once.
+
+    Args:
+        hdb: sqlite3 database handle
+
+    Returns:
+        True if the pitchfx table was migrated
+    """
+    hdb.execute("PRAGMA table_info(pitchfx)")
+    columns = set(row[1] for row in hdb.fetchall())
+    new = [(column, ctype) for column, ctype, index in PFX_EVENT if column not in columns]
+    if not new:
+        return False
+    for column, ctype in new:
+        hdb.execute("ALTER TABLE pitchfx ADD COLUMN %s %s" %(column, ctype))
+    # the event columns have the same names in both tables
+    names = [column for column, ctype, index in PFX_EVENT]
+    comm = "UPDATE pitchfx SET (%s) = (SELECT %s FROM events " \
+        "WHERE events.game_id=pitchfx.game_id " \
+        "AND events.event_id=pitchfx.cur_event)" %(", ".join(names),
+        ", ".join("events."+name for name in names))
+    hdb.execute(comm)
+    hdb.execute("SELECT name FROM sqlite_master WHERE name='ingest_version'")
+    if hdb.fetchone():
+        version_bump(hdb)
+    hdb.connection.commit()
+    return True
+
+
+def index_init(hdb):
+    """Build the indexes of the database that do not exist yet
+
+    Builds the unique indexes of the events and pitchfx tables and the
+    secondary indexes of INDEXES. Databases created before the unique
+    indexes were split from the tables keep their UNIQUE constraints and
+    are left alone. Duplicate rows left by an interrupted bulk load are
+    removed before a unique index is built.
+
+    Args:
+        hdb: sqlite3 database handle
+
+    Returns:
+        List of names of the indexes built
+    """
+    missing = index_check(hdb)
+    for name, table, columns, keep in UNIQUE_INDEXES:
+        if name not in missing:
+            continue
+        comm = "CREATE UNIQUE INDEX %s ON %s %s" %(name, table, columns)
+        try:
+            hdb.execute(comm)
+        except sqlite3.IntegrityError:
+            hdb.execute("DELETE FROM %s WHERE rowid NOT IN " \
+                "(SELECT %s(rowid) FROM %s GROUP BY %s)" %(table, keep, table, columns[1:-1]))
+            hdb.connection.commit()
+            hdb.execute(comm)
+    for name, table, columns in INDEXES:
+        if name in missing:
+            hdb.execute("CREATE INDEX %s ON %s %s" %(name, table, columns))
+    return missing
+
+
+def index_check(hdb):
+    """Find the indexes missing from the database
+
+    Args:
+        hdb: sqlite3 database handle
+
+    Returns:
+        List of names of the unique and secondary indexes that do not exist
+    """
+    hdb.execute("SELECT type, name, tbl_name, sql FROM sqlite_master")
+    indexes = set()
+    inline = set()
+    for kind, name, table, sql in hdb.fetchall():
+        if kind == 'index':
+            indexes.add(name)
+        elif kind == 'table' and "UNIQUE" in sql:
+            inline.add(table)
+    missing = []
+    for name, table, columns, keep in UNIQUE_INDEXES:
+        if name not in indexes and table not in inline:
+            missing.append(name)
+    for name, table, columns in INDEXES:
+        if name not in indexes:
+            missing.append(name)
+    return missing
+
+
+def query_plan(hdb, query, args=()):
+    """Describe how sqlite runs a query
+
+    Args:
+        hdb: sqlite3 database handle
+        query: sql query
+        args: parameters of the query
+
+    Returns:
+        List of the detail lines of EXPLAIN QUERY PLAN
+    """
+    hdb.execute("EXPLAIN QUERY PLAN "+query, args)
+    return [row[-1] for row in hdb.fetchall()]
+
+
+def bulk_begin(hdb):
+    """Prepare the database for a bulk load
+
+    Switches to a write-ahead log without syncing every commit and drops
+    the unique indexes of the events and pitchfx tables and the secondary
+    indexes, so rows are appended without index maintenance. bulk_end
+    restores both.
+
+    Args:
+        hdb: sqlite3 database handle
+    """
+    hdb.connection.commit()
+    hdb.execute("PRAGMA journal_mode = WAL")
+    hdb.execute("PRAGMA synchronous = NORMAL")
+    hdb.execute("PRAGMA temp_store = MEMORY")
+    hdb.execute("PRAGMA cache_size = -262144")
+    for index in UNIQUE_INDEXES + INDEXES:
+        hdb.execute("DROP INDEX IF EXISTS %s" %(index[0]))
+
+
+def bulk_end(hdb):
+    """Finish a bulk load
+
+    Builds the indexes dropped by bulk_begin in one pass each, updates the
+    query planner statistics and returns to the default journal.
+
+    Args:
+        hdb: sqlite3 database handle
+    """
+    hdb.connection.commit()
+    index_init(hdb)
+    hdb.execute("ANALYZE")
+    hdb.connection.commit()
+    hdb.execute("PRAGMA journal_mode = DELETE")
+    hdb.execute("PRAGMA synchronous = FULL")
+
+
+def manifest_init(hdb):
+    """Initializes ingest bookkeeping tables
+
+    Creates the tables if they do not exist yet, so it also upgrades
+    databases created before they were added.
+
+    Args:
+        hdb: sqlite3 database handle
+
+    Returns:
+        Bookkeeping tables in the sqlite PitchFX database
+    """
+    hdb.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = set(name for name, in hdb.fetchall())
+
+    # ingest status of days (game '') and of the games on them
+    comm = "CREATE TABLE IF NOT EXISTS ingest_manifest (" \
+        "date INTEGER, " \
+        "game TEXT, " \
+        "game_id INTEGER, " \
+        "status TEXT, " \
+        "UNIQUE(date, game)" \
         ")"
     hdb.execute(comm)
+    if 'ingest_manifest' not in tables:
+        # days loaded before the manifest existed are taken as complete
+        comm = "INSERT OR IGNORE INTO ingest_manifest " \
+            "SELECT DISTINCT date, '', NULL, 'committed' FROM games"
+        hdb.execute(comm)
+
+    # first and last game date of each season and game type
+    comm = "CREATE TABLE IF NOT EXISTS seasons (" \
+        "year INTEGER, " \
+        "game_type TEXT, " \
+        "first_date INTEGER, " \
+        "last_date INTEGER, " \
+        "UNIQUE(year, game_type)" \
+        ")"
+    hdb.execute(comm)
+    if 'seasons' not in tables:
+        season_index(hdb)
+
+    # version of the data, bumped by every load that writes rows
+    comm = "CREATE TABLE IF NOT EXISTS ingest_version (" \
+        "version INTEGER" \
+        ")"
+    hdb.execute(comm)
+    if 'ingest_version' not in tables:
+        hdb.execute("INSERT INTO ingest_version VALUES (0)")
+
+
+def version_bump(hdb):
+    """Mark the data of the database as changed
+
+    Readers caching query results (see ResultCache in Player) compare the
+    version to know when their results are stale.
+
+    Args:
+        hdb: sqlite3 database handle
+    """
+    hdb.execute("UPDATE ingest_version SET version=version+1")
+
+
+def season_index(hdb):
+    """Update the season index from the games in the database
+
+    Args:
+        hdb: sqlite3 database handle
+
+    Returns:
+        Filled seasons table
+    """
+    comm = "INSERT OR REPLACE INTO seasons " \
+        "SELECT date/10000, game_type, min(date), max(date) FROM games " \
+        "GROUP BY date/10000, game_type"
+    hdb.execute(comm)
+
+
+def season_windows(hdb):
+    """Find the days of each indexed season that can have games
+
+    A season runs from the first day of SEASON_WINDOW, or its first indexed
+    game if earlier, to the last day of the window, or its last indexed
+    game if later. The world series does not end the window early, since
+    a load can stop before its last game; days after it are listed once
+    and then skipped through the ingest manifest.
+
+    Args:
+        hdb: sqlite3 database handle
+
+    Returns:
+        Dictionary of (first date, last date) per year
+    """
+    hdb.execute("SELECT year, game_type, first_date, last_date FROM seasons")
+    seasons = collections.defaultdict(dict)
+    for year, game_type, first, last in hdb.fetchall():
+        seasons[year][game_type] = (first, last)
+    windows = {}
+    for year, types in seasons.items():
+        first = min([year*10000+SEASON_WINDOW[0]] + [f for f, l in types.values()])
+        last = max([year*10000+SEASON_WINDOW[1]] + [l for f, l in types.values()])
+        windows[year] = (first, last)
+    return windows
+
+
+def ingest_plan(hdb, date1, date2, root=GD2_ROOT):
+    """Plan the days and games of a date range missing from the database
+
+    Days recorded as committed in the ingest manifest are left out. Days
+    that were listed in full but not completed (day status pending) are
+    planned with only their games that are not committed or skipped, so
+    they are not listed again. Days without a day status, such as a day
+    interrupted partway, are listed again, since their manifest can miss
+    games that were never reached.
+
+    Args:
+        hdb: sqlite3 database handle
+        date1: starting date (yyyymmdd integer)
+        date2: ending date (yyyymmdd integer)
+        root: url of the gd2 tree
+
+    Returns:
+        List of (date, url of day directory, games) where games is None if
+        the day has to be listed, else the list of game directories to load
+    """
+    comm = "SELECT date, game, status FROM ingest_manifest " \
+        "WHERE date BETWEEN ? AND ?"
+    hdb.execute(comm, (date1, date2))
+    days = {}
+    games = collections.defaultdict(list)
+    for date, game, status in hdb.fetchall():
+        if game == '':
+            days[date] = status
+        elif status not in MANIFEST_DONE:
+            games[date].append(game)
+    plan = []
+    for date, url_root in gd2_days(date1, date2, root, season_windows(hdb)):
+        if days.get(date) == 'committed':
+            continue
+        if days.get(date) == 'pending':
+            plan.append((date, url_root, games[date]))
+        else:
+            plan.append((date, url_root, None))
+    return plan
+
+
+class PitchfxWriter():
+    """Buffered writer of rows to the PitchFX database
+
+    Rows are kept in memory per table and written with executemany using
+    the prepared INSERTS statements, in one transaction per commit_every
+    games.
+    """
+    def __init__(self, db, hdb, commit_every=1):
+        """Initialize writer
+
+        Args:
+            db: sqlite database cursor
+            hdb: sqlite3 database handle
+            commit_every: number of games written per transaction
+        """
+        self.db = db
+        self.hdb = hdb
+        self.commit_every = max(commit_every, 1)
+        self.ngames = 0
+        self.rows = dict((table, []) for table, insert in INSERTS)
+        # games already in the database
+        self.hdb.execute("SELECT game_id FROM games")
+        self.game_ids = set(game_id for game_id, in self.hdb.fetchall())
+        self.day_complete = True
+        # (player_id, position) pairs already in the players table
+        self.hdb.execute("SELECT player_id, position FROM players")
+        self.players = set((int(pid), pos) for pid, pos in self.hdb.fetchall())
+        # known dob of every player id, so only new ids are fetched
+        self.hdb.execute("SELECT player_id, max(dob) FROM players GROUP BY player_id")
+        self.dobs = dict((int(pid), dob) for pid, dob in self.hdb.fetchall() if dob > 0)
+
+    def add(self, table, info):
+        """Buffer a row of a table
+
+        Args:
+            table: name of the table
+            info: tuple of column values
+        """
+        self.rows[table].append(info)
+        if table == 'games':
+            self.game_ids.add(info[0])
+        elif table == 'players':
+            self.players.add((int(info[0]), info[3]))
+
+    def has_game(self, game_id):
+        """Check whether a game is already in the database
+
+        Args:
+            game_id: game id
+
+        Returns:
+            True if the game is buffered or in the database
+        """
+        return game_id in self.game_ids
+
+    def has_player(self, player_id, pos):
+        """Check whether a player is already in the database
+
+        Args:
+            player_id: player id
+            pos: position of player
+
+        Returns:
+            True if the (player_id, position) pair is buffered or in the database
+        """
+        return (int(player_id), pos) in self.players
+
+    def mark_game(self, date, gg, status, game_id=None):
+        """Record the ingest status of a game in the manifest
+
+        Args:
+            date: date of the game (yyyymmdd integer)
+            gg: name of the gd2 game directory
+            status: pending (not downloaded), fetched (not parsed),
+                committed (in the database) or skipped (not loaded)
+            game_id: game id if known
+        """
+        self.add('ingest_manifest', (date, gg, game_id, status))
+        if status not in MANIFEST_DONE:
+            self.day_complete = False
+
+    def end_day(self, date):
+        """Record the ingest status of a day once all its games are seen
+
+        Args:
+            date: date of the day (yyyymmdd integer)
+        """
+        if self.day_complete:
+            status = 'committed'
+        else:
+            status = 'pending'
+        self.add('ingest_manifest', (date, '', None, status))
+        self.day_complete = True
+
+    def end_game(self):
+        """Mark the end of a game, commit every commit_every games"""
+        self.ngames += 1
+        if self.ngames >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows and commit
+
+        The ingest version is bumped only when rows of data tables were
+        written, not for ingest manifest rows alone.
+        """
+        wrote = False
+        for table, insert in INSERTS:
+            if self.rows[table]:
+                self.hdb.executemany(insert, self.rows[table])
+                self.rows[table] = []
+                if table != 'ingest_manifest':
+                    wrote = True
+        if wrote:
+            version_bump(self.hdb)
+        self.db.commit()
+        self.ngames = 0
+
+
+class InningState():
+    """Ball/strike, base-runner and event state of a single game
+
+    Fed the innings, half innings, actions and at-bats of inning_all.xml in
+    document order and collects the rows of the events and pitchfx tables.
+    """
+    def __init__(self, game_id):
+        """Initialize state at the start of a game
+
+        Args:
+            game_id: game id
+        """
+        self.game_id = game_id
+        self.pitches = []
+        self.events = collections.OrderedDict()
+        # intialize events and scores
+        self.event_id = 0
+        self.action_flag = 0
+        self.event_description = None
+        self.pre_home_score = 0
+        self.post_home_score = 0
+        self.pre_away_score = 0
+        self.post_away_score = 0
+
+    def add_event(self, description, pre_outs, post_outs, pitcher_id, batter_id, replace):
+        """Add a row of the events table at the current event id
+
+        Args:
+            description: event description
+            pre_outs: outs before the event
+            post_outs: outs after the event
+            pitcher_id: id of pitcher
+            batter_id: id of batter
+            replace: replace an event with the same id instead of ignoring
+        """
+        if replace or self.event_id not in self.events:
+            self.events[self.event_id] = (self.game_id, self.event_id, description, self.inning_num, self.is_top, pre_outs, post_outs, pitcher_id, batter_id, self.pre_1b, self.post_1b, self.pre_2b, self.post_2b, self.pre_3b, self.post_3b, self.post_home, self.pre_home_score, self.post_home_score, self.pre_away_score, self.post_away_score)
+
+    def pitch_rows(self):
+        """Complete the pitches with the columns of their events
+
+        Called once the whole game is read, since the event of a pitch can
+        be replaced by later tags of its at-bat.
+
+        Returns:
+            List of rows of the pitchfx table
+        """
+        rows = []
+        for info in self.pitches:
+            event = self.events.get(info[PFXKEYS['cur_event']])
+            if event == None:
+                rows.append(info + [None]*len(PFX_EVENT))
+            else:
+                rows.append(info + [event[index] for column, ctype, index in PFX_EVENT])
+        return rows
+
+    def inning(self, iinfo):
+        """Start an inning
+
+        Args:
+            iinfo: attributes of the inning tag
+        """
+        self.inning_num = iinfo['num']
+
+    def half(self, tag):
+        """Start the top or bottom of an inning
+
+        Args:
+            tag: top or bottom
+        """
+        self.post_outs = 0
+        self.pre_1b = 0
+        self.post_1b = 0
+        self.pre_2b = 0
+        self.post_2b = 0
+        self.pre_3b = 0
+        self.post_3b = 0
+        self.post_home = 0
+        if tag == 'top':
+            self.is_top = 1
+        else:
+            self.is_top = 0
+
+    def action(self, edict):
+        """Keep track of in-game player changes
+
+        Args:
+            edict: attributes of the action tag
+        """
+        action_description = edict['des']
+        if 'Pinch-Hitter' in action_description:
+            self.action_flag = 1
+        elif 'Change' in action_description:
+            self.action_flag = 1
+
+    def atbat(self, edict, children):
+        """Add the pitches and runner events of an at-bat
+
+        Args:
+            edict: attributes of the atbat tag
+            children: list of (tag, attributes) of the pitch, runner and po
+                tags of the at-bat
+        """
+        pre_outs = self.post_outs
+        # reset count at beginning of at-bat
+        pre_balls = 0
+        post_balls = 0
+        pre_strikes = 0
+        post_strikes = 0
+        # to account for strikeouts
+        max_strikes = int(edict['s'])
+        ab = int(edict['num'])
+        pitcher_id = int(edict['pitcher'])
+        batter_id = int(edict['batter'])
+        end_of_ab_outs = int(edict['o'])
+        event_description_ab = edict['event']
+        # if there is a previous action then write current ab info as event
+        if self.action_flag == 1:
+            self.add_event(self.event_description, pre_outs, self.post_outs, pitcher_id, batter_id, False)
+            self.event_id += 1
+        try:
+            self.pre_home_score = self.post_home_score
+            self.pre_away_score = self.post_away_score
+            self.post_home_score = edict['home_team_runs']
+            self.post_away_score = edict['away_team_runs']
+        except:
+            pass
+        # reset action flag
+        self.action_flag = 0
+        runner_flag = 0
+        # read in pitches
+        for tag, idict in children:
+            # update runners if necessary
+            if (tag != "runner") and (runner_flag == 0):
+                self.pre_1b = self.post_1b
+                self.pre_2b = self.post_2b
+                self.pre_3b = self.post_3b
+                self.post_home = 0
+                self.event_id += 1
+            # registered pitch
+            if tag == 'pitch':
+                runner_flag = 1
+                # initialize pitchfx list and read in basic info
+                info = [None]*len(PFXKEYS)
+                info[PFXKEYS['game_id']] = self.game_id
+                info[PFXKEYS['at_bat']] = ab
+                info[PFXKEYS['cur_event']] = self.event_id
+                try:
+                    time_stamp = int(idict['sv_id'][-6:])
+                    info[PFXKEYS['time']] = time_stamp
+                except:
+                    pass
+                # only fill in pitchfx info that exist
+                common = set(idict.keys()).intersection(PFXKEYS)
+                for pfxvars in common:
+                    info[PFXKEYS[pfxvars]] = idict[pfxvars]
+                # update balls and strikes information
+                if idict['type'] == 'B':
+                    post_balls = min(pre_balls+1,4)
+                    post_strikes = pre_strikes
+                elif idict['type'] == 'S':
+                    post_balls = pre_balls
+                    if idict['des'] == 'Foul':
+                        post_strikes = min(pre_strikes+1,2)
+                    else:
+                        post_strikes = min(pre_strikes+1,max_strikes)
+                else:
+                    post_balls = pre_balls
+                    post_strikes = pre_strikes
+                info[PFXKEYS['pre_balls']] = pre_balls
+                info[PFXKEYS['post_balls']] = post_balls
+                info[PFXKEYS['pre_strikes']] = pre_strikes
+                info[PFXKEYS['post_strikes']] = post_strikes
+                # fill in pitchfx table
+                self.pitches.append(info)
+                # update balls and strikes again
+                pre_balls = post_balls
+                pre_strikes = post_strikes
+            # initialize runner events(s)
+            elif tag == 'runner':
+                runner_id = idict['id']
+                self.event_description = idict['event']
+                base_start = idict['start']
+                flag1 = 0
+                flag2 = 0
+                flag3 = 0
+                if base_start == "1B":
+                    self.pre_1b = runner_id
+                    flag1 = 1
+                elif base_start == "2B":
+                    self.pre_2b = runner_id
+                    flag2 = 1
+                elif base_start == "3B":
+                    self.pre_3b = runner_id
+                    flag3 = 1
+                base_end = idict['end']
+                if base_end == "":
+                    try:
+                        if idict['score'] == "T":
+                            self.post_home = runner_id
+                    except:
+                        self.post_outs = pre_outs+1
+                elif base_end == "1B":
+                    self.post_1b = runner_id
+                elif base_end == "2B":
+                    self.post_2b = runner_id
+                elif base_end == "3B":
+                    self.post_3b = runner_id
+                if base_start != base_end:
+                    if flag1 == 1:
+                        self.post_1b = 0
+                    elif flag2 == 1:
+                        self.post_2b = 0
+                    elif flag3 == 1:
+                        self.post_3b = 0
+                # fill in event table
+                self.add_event(self.event_description, pre_outs, self.post_outs, pitcher_id, batter_id, True)
+                # upcoming runner tags are not separate events
+                runner_flag = 0
+            # handle pitch-outs
+            elif tag == 'po':
+                runner_flag = 1
+                self.event_description = idict['des']
+                # fill in event table
+                self.add_event(self.event_description, pre_outs, self.post_outs, pitcher_id, batter_id, False)
+                self.event_id += 1
+        # add end of at-bat information only if an out
+        if end_of_ab_outs > pre_outs:
+            # if last entry in ab is not runner then there was nobody on base (new event)
+            self.add_event(event_description_ab, pre_outs, end_of_ab_outs, pitcher_id, batter_id, True)
+            # update outs
+            self.post_outs = end_of_ab_outs
+
+
+def inning_tree(state, log):
+    """Feed a parsed inning_all.xml tree to an inning state
+
+    Args:
+        state: InningState of the game
+        log: root element of inning_all.xml
+    """
+    # loop over inning
+    for header in log:
+        state.inning(header.attrib)
+        for inning in header:
+            state.half(inning.tag)
+            # loop over events in an inning
+            for etype in inning:
+                if etype.tag == 'action':
+                    state.action(etype.attrib)
+                elif etype.tag == 'atbat':
+                    state.atbat(etype.attrib, [(event.tag, event.attrib) for event in etype])
+
+
+def inning_stream(state, source):
+    """Feed inning_all.xml to an inning state while it is parsed
+
+    Uses iterparse of the vendored ElementTree. Each action and at-bat is
+    handled as soon as its end tag arrives and then dropped from the tree,
+    so only the current at-bat is held in memory and parsing runs as the
+    file is read.
+
+    Args:
+        state: InningState of the game
+        source: file object of inning_all.xml
+    """
+    stack = []
+    for event, elem in VET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if len(stack) == 2:
+                state.inning(elem.attrib)
+            elif len(stack) == 3:
+                state.half(elem.tag)
+            continue
+        stack.pop()
+        if len(stack) == 3:
+            if elem.tag == 'action':
+                state.action(elem.attrib)
+            elif elem.tag == 'atbat':
+                state.atbat(elem.attrib, [(event.tag, event.attrib) for event in elem])
+            stack[-1].remove(elem)
+
+
+class ElementHandler():
+    """Expat handler listing the tags at a given depth of a document"""
+    def __init__(self, depth):
+        """Initialize handler
+
+        Args:
+            depth: depth of the listed tags, 1 being the root
+        """
+        self.depth = depth
+        self.level = 0
+        self.root = None
+        self.elements = []
+
+    def start(self, tag, attrib):
+        """Handle a start tag"""
+        self.level += 1
+        if self.level == 1:
+            self.root = attrib
+        if self.level == self.depth:
+            self.elements.append((tag, attrib))
+
+    def end(self, tag):
+        """Handle an end tag"""
+        self.level -= 1
+
+
+class InningHandler():
+    """Expat handler feeding inning_all.xml to an inning state
+
+    Runs the same InningState as inning_tree and inning_stream straight
+    from the expat callbacks, without building any Element objects.
+    """
+    def __init__(self, state):
+        """Initialize handler
+
+        Args:
+            state: InningState of the game
+        """
+        self.state = state
+        self.level = 0
+        self.attrib = None
+        self.children = None
+
+    def start(self, tag, attrib):
+        """Handle a start tag"""
+        self.level += 1
+        if self.level == 2:
+            self.state.inning(attrib)
+        elif self.level == 3:
+            self.state.half(tag)
+        elif self.level == 4:
+            self.attrib = attrib
+            self.children = []
+        elif self.level == 5:
+            self.children.append((tag, attrib))
+
+    def end(self, tag):
+        """Handle an end tag"""
+        if self.level == 4:
+            if tag == 'action':
+                self.state.action(self.attrib)
+            elif tag == 'atbat':
+                self.state.atbat(self.attrib, self.children)
+        self.level -= 1
+
+
+def expat_parse(handler, source):
+    """Run an expat handler over a document
+
+    Args:
+        handler: object with start and end methods
+        source: string or file object of the document
+
+    Returns:
+        handler
+    """
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    if hasattr(source, 'read'):
+        parser.ParseFile(source)
+    else:
+        parser.Parse(source, True)
+    return handler
+
+
+def expat_elements(data, depth):
+    """List the tags at a given depth of a document without building a tree
+
+    Args:
+        data: string of the document
+        depth: depth of the listed tags, 1 being the root
+
+    Returns:
+        Attributes of the root tag, list of (tag, attributes) at depth
+    """
+    handler = expat_parse(ElementHandler(depth), data)
+    return handler.root, handler.elements
+
+
+def tree_elements(data, depth):
+    """List the tags at a given depth of a document parsed into a tree
+
+    Args:
+        data: string of the document
+        depth: depth of the listed tags, 1 being the root
+
+    Returns:
+        Attributes of the root tag, list of (tag, attributes) at depth
+    """
+    log = ET.fromstring(data)
+    elems = [log]
+    for ii in range(depth-1):
+        elems = [child for elem in elems for child in elem]
+    return log.attrib, [(elem.tag, elem.attrib) for elem in elems]
+
+
+def fetch_url(url):
+    """Read the contents of a url
+
+    Args:
+        url: address of the file to read
+
+    Returns:
+        Contents of the url as a string, None if it could not be read or
+        the server did not answer 200 (urllib returns error pages as
+        contents)
+    """
+    try:
+        response = urllib.urlopen(url)
+        try:
+            if response.getcode() != 200:
+                return None
+            return response.read()
+        finally:
+            response.close()
+    except:
+        return None
+
+
+def read_local(path):
+    """Read a file or directory of a local gd2 mirror
+
+    Args:
+        path: path of the file or directory
+
+    Returns:
+        Contents of the file, html listing of the subdirectories of a
+        directory, None if the path does not exist
+    """
+    if os.path.isdir(path):
+        names = sorted(os.listdir(path))
+        return "\n".join(['<li><a href="%s/">%s/</a></li>' %(name, name)
+            for name in names if os.path.isdir(os.path.join(path, name))])
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+class RawStore():
+    """Source of raw gd2 responses
+
+    Reads from http, optionally through a persistent cache of gzip files
+    stored under the url path relative to the gd2 root, or from a local
+    mirror directory of the gd2 tree. The cache can be shared between runs
+    and databases, so a season is downloaded once and reparsed from disk.
+    """
+    def __init__(self, root=GD2_ROOT, cache=None, mirror=None, offline=False):
+        """Initialize store
+
+        Args:
+            root: url of the gd2 tree
+            cache: directory of the response cache, None for no cache
+            mirror: local directory of the gd2 tree, read instead of root
+            offline: read from the cache only, never from http
+        """
+        if offline and cache == None and mirror == None:
+            raise ValueError("offline reads need a cache directory")
+        if mirror != None:
+            root = mirror
+        self.root = root.rstrip('/')
+        self.cache = cache
+        self.mirror = mirror
+        self.offline = offline
+
+    def cache_path(self, url):
+        """Path of the cached response of a url
+
+        Args:
+            url: url under the gd2 root
+
+        Returns:
+            Path of the gzip file in the cache directory
+        """
+        path = url[len(self.root):].strip('/')
+        # directory listings
+        if not path.endswith('.xml'):
+            path = path+'/index.html'
+        return os.path.join(self.cache, path+'.gz')
+
+    def store(self, path, output):
+        """Write a response to the cache
+
+        Args:
+            path: path of the gzip file in the cache directory
+            output: contents of the response
+        """
+        dirname = os.path.dirname(path)
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            pass
+        # write to a temporary file first so readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            gz = gzip.GzipFile(fileobj=f, mode='wb')
+            gz.write(output)
+            gz.close()
+        os.rename(tmp, path)
+
+    def read(self, url):
+        """Read the contents of a url
+
+        Args:
+            url: url under the gd2 root
+
+        Returns:
+            Contents of the url as a string, None if it could not be read
+        """
+        if self.mirror != None:
+            return read_local(url)
+        if self.cache != None:
+            path = self.cache_path(url)
+            if os.path.isfile(path):
+                gz = gzip.open(path, 'rb')
+                try:
+                    return gz.read()
+                finally:
+                    gz.close()
+        if self.offline:
+            return None
+        output = fetch_url(url)
+        if output != None and self.cache != None:
+            self.store(path, output)
+        return output
+
+    def open(self, url):
+        """Open a url for streaming
+
+        Args:
+            url: url under the gd2 root
+
+        Returns:
+            File object of the contents of the url, IOError if it cannot
+            be read or the server did not answer 200
+        """
+        if self.mirror != None:
+            return open(url, 'rb')
+        if self.cache != None:
+            path = self.cache_path(url)
+            if not os.path.isfile(path):
+                self.read(url)
+            return gzip.open(path, 'rb')
+        if self.offline:
+            raise IOError("not in cache: %s" %(url))
+        response = urllib.urlopen(url)
+        if response.getcode() != 200:
+            response.close()
+            raise IOError("http %s: %s" %(response.getcode(), url))
+        return response
+
+
+def fetch_day(store, url_root):
+    """List the games played on a given day
+
+    Args:
+        store: RawStore to read from
+        url_root: url of the gd2 day directory
+
+    Returns:
+        List of game directory names, None if the day could not be read
+    """
+    output = store.read(url_root)
+    if output == None:
+        return None
+    # create list of game ids on given day
+    ggs = []
+    for line in output.splitlines():
+        find = STR_GAME.search(line)
+        if find:
+            ggs.append(find.group(1))
+    return ggs
+
+
+def fetch_game(store, url_game, stream=False):
+    """Download the raw xml files of a single game
+
+    Args:
+        store: RawStore to read from
+        url_game: url of the gd2 game directory
+        stream: leave inning_all.xml to be streamed while it is parsed
+
+    Returns:
+        Dictionary of game.xml, players.xml and inning_all.xml contents
+    """
+    raw = {}
+    raw['game'] = store.read(url_game+"/game.xml")
+    raw['players'] = store.read(url_game+"/players.xml")
+    if not stream:
+        raw['inning'] = store.read(url_game+"/inning/inning_all.xml")
+    return raw
 
 
-def pitchfx_add(db, hdb, date1, date2, prompt):
+def fetch_stream(game, store, parser='tree', skip=None):
+    """Download a single game and parse inning_all.xml while it downloads
+
+    Runs as a task of the download pool, so the inning files of several
+    games stream at once.
+
+    Args:
+        game: (date, game directory name, url of game directory) from
+            gd2_games
+        store: RawStore to read from
+        parser: xml parser, 'tree' (ElementTree) or 'expat' (no tree)
+        skip: function of game id, True if the game is not to be parsed
+
+    Returns:
+        Dictionary of game.xml and players.xml contents from fetch_game and
+        the rows from parse_game, None if the files could not be read
+    """
+    date, gg, url_game = game
+    if gg == None:
+        return None, None
+    raw = fetch_game(store, url_game, stream=True)
+    if not fetch_complete(raw):
+        return raw, None
+    return raw, parse_game(store, date, url_game, raw, True, parser, skip)
+
+
+def pool_map(pool, func, items, depth):
+    """Map a function over items on a thread pool
+
+    Keeps at most depth calls in flight and yields results in the order of
+    items, so downloads run ahead of the consumer without holding a whole
+    season in memory.
+
+    Args:
+        pool: thread pool, None to map serially
+        func: function of a single item
+        items: iterable of items, consumed lazily
+        depth: maximum number of calls in flight
+
+    Returns:
+        Generator of (item, func(item)) pairs
+    """
+    if pool == None:
+        for item in items:
+            yield item, func(item)
+        return
+    pending = collections.deque()
+    for item in items:
+        pending.append((item, pool.apply_async(func, (item,))))
+        if len(pending) >= max(depth, 1):
+            item, result = pending.popleft()
+            yield item, result.get()
+    while pending:
+        item, result = pending.popleft()
+        yield item, result.get()
+
+
+def gd2_days(date_start, date_end, root, windows=None):
+    """Iterate over gd2 day directories between two dates
+
+    Only days inside the season window of their year are visited, so
+    impossible dates and the offseason are never requested.
+
+    Args:
+        date_start: first date (yyyymmdd integer)
+        date_end: last date (yyyymmdd integer)
+        root: url of the gd2 tree
+        windows: dictionary of (first date, last date) per year from
+            season_windows, SEASON_WINDOW is used for other years
+
+    Returns:
+        Generator of (date, url of day directory) pairs
+    """
+    if windows == None:
+        windows = {}
+    for year in range(date_start/10000, date_end/10000+1):
+        first, last = windows.get(year, (year*10000+SEASON_WINDOW[0],
+                                         year*10000+SEASON_WINDOW[1]))
+        first = max(first, date_start)
+        last = min(last, date_end)
+        if first > last:
+            continue
+        day = datetime.date(first/10000, first/100%100, first%100)
+        while True:
+            date = day.year*10000 + day.month*100 + day.day
+            if date > last:
+                break
+            url_root = root+"/year_%s/month_%s/day_%s" %(day.year, str(day.month).zfill(2), str(day.day).zfill(2))
+            yield date, url_root
+            day += datetime.timedelta(days=1)
+
+
+def gd2_games(store, days, pool, depth):
+    """Iterate over the games of gd2 day directories
+
+    Args:
+        store: RawStore to read from
+        days: iterable of (date, url of day directory, games) from
+            ingest_plan, the day is listed if games is None
+        pool: thread pool used to list days ahead, None to list serially
+        depth: maximum number of day listings in flight
+
+    Returns:
+        Generator of (date, game directory name, url of game directory),
+        followed by (date, None, None) once all games of a day are listed
+    """
+    fetch = lambda day: fetch_day(store, day[1]) if day[2] == None else day[2]
+    for (date, url_root, planned), ggs in pool_map(pool, fetch, days, depth):
+        if ggs == None:
+            continue
+        for gg in ggs:
+            yield date, gg, url_root+"/%s" %(gg)
+        yield date, None, None
+
+
+def fetch_complete(raw):
+    """Check that every downloaded file of a game could be read
+
+    Args:
+        raw: dictionary of raw xml files from fetch_game
+
+    Returns:
+        True if no file failed to download
+    """
+    return raw != None and None not in raw.values()
+
+
+def pitchfx_add(db, hdb, date1, date2, prompt, workers=1, root=GD2_ROOT,
+                commit_every=1, stream=False, parser='tree', processes=1,
+                cache=None, mirror=None, offline=False, bulk=False):
     """Add information to database
 
-    Fill Sqlite3 databases with pitchfx data from http://gd2.mlb.com/.
+    Fill Sqlite3 databases with pitchfx data from http://gd2.mlb.com/. Days
+    and games are downloaded ahead on a pool of worker threads and can be
+    parsed on a pool of worker processes, or while they download on the
+    worker threads when streamed, while the database is written from the
+    calling thread only.
 
     Args:
         db: sqlite database cursor
@@ -170,508 +1453,330 @@ def pitchfx_add(db, hdb, date1, date2, prompt):
         date1: starting date to fill database
         date2: ending date to fill database
         prompt: flag to determine whether to ask to continue adding data
+        workers: number of download threads
+        root: url of the gd2 tree
+        commit_every: number of games written per transaction
+        stream: parse inning_all.xml while it is downloaded, on the
+            download threads, instead of reading it whole
+        parser: xml parser, 'tree' (ElementTree) or 'expat' (no tree)
+        processes: number of parsing processes, 1 to parse in the calling
+            process, not used when streaming
+        cache: directory of the raw response cache, None for no cache
+        mirror: local directory of the gd2 tree, read instead of root
+        offline: read from the cache only, never from http
+        bulk: load without the unique indexes of the events and pitchfx
+            tables and with relaxed syncing, building the indexes at the end
 
     Returns:
         Filled tables of the database
     """
-    # intial pitch data vector of nulls
-    comm = "PRAGMA table_info(pitchfx)"
-    hdb.execute(comm)
-    npfx = len(hdb.fetchall())
-    pfxinit = [None]*npfx
-
-    # game types
-    gtypes = ['R', 'F', 'D', 'L', 'W']
-
-    # pitchfx variables: sqlite3 database indices
-    pfxkeys = {
-        'game_id': 0,
-        'id': 1,
-        'at_bat': 2,
-        'time': 3,
-        'cur_event': 4,
-        'des': 5,
-        'type': 6,
-        'pre_balls': 7,
-        'post_balls': 8,
-        'pre_strikes': 9,
-        'post_strikes': 10,
-        'start_speed': 11,
-        'end_speed': 12,
-        'sz_top': 13,
-        'sz_bot': 14,
-        'pfx_x': 15,
-        'pfx_z': 16,
-        'px': 17,
-        'pz': 18,
-        'x': 19,
-        'y': 20,
-        'x0': 21,
-        'y0': 22,
-        'z0': 23,
-        'vx0': 24,
-        'vy0': 25,
-        'vz0': 26,
-        'ax': 27,
-        'ay': 28,
-        'az': 29,
-        'break_y': 30,
-        'break_angle': 31,
-        'break_length': 32,
-        'spin_dir': 33,
-        'spin_rate': 34,
-        'pitch_type': 35
-        }
-
-    # determine which dates already exist in the database
-    query = "SELECT min(date) FROM games"                                       
-    hdb.execute(query)                                                          
-    dbmin = hdb.fetchone()[0]                                                   
-    # empty database                                                            
-    if dbmin == None:
-        date_start = date1                                                      
-        date_end = date2                                                        
-    else:                                                                       
-        query = "SELECT max(date) FROM games"                                   
-        hdb.execute(query)
-        dbmax = hdb.fetchone()[0]
-        # date1 date2 dbmin dbmax                                               
-        if date2 < dbmin:                                                       
-            date_start = date1                                                  
-            date_end = date2                                                    
-        # dbmin dbmax date1 date2                                               
-        elif date1 > dbmax:                                                     
-            date_start = date1                                                  
-            date_end = date2                                                    
-        # date1 dbmin date2 dbmax                                               
-        # date1 dbmin dbmax date2                                               
-        elif date1 < dbmin:                                                     
-            date_start = date1                                                  
-            if date2 <= dbmax:                                                  
-                date_end = dbmin                                                
-            else:                                                               
-                date_end = date2                                                
-        # dbmin date1 dbmax date2                                               
-        elif dbmin <= date1:                                                     
-            if date2 >= dbmax:                                                   
-                date_start = dbmax                                              
-                date_end = date2                                                
-            # dbmin date1 date2 dbmax                                           
-            else:                                                               
-                date_start = dbmin                                              
-                date_end = dbmax   
-
-    # loop through dates (as defined by the date_start and date_end values)
-    sdate_start = str(date_start)
-    sdate_end = str(date_end)
-    years = [sdate_start[:4], sdate_end[:4]]
-    months = [sdate_start[4:6], sdate_end[4:6]]
-    month = int(months[0])
-    days = [sdate_start[-2:], sdate_end[-2:]]
-    day = int(days[0])
-
-    # set up regular expression
-    str_game = re.compile("""^.+href="(gid_\d+_\d+_\d+_.+)/".+$""")
-    str_xml = re.compile("""^.+href="(.+\.xml)".+$""")
-
-    # loop over years, months, days for games
-    for year in range(int(years[0]), int(years[1])+1):
-        while month < 13:
-            while day < 32:
-                # determine whether there are any files to look at on given day
+    # parse games on a process pool, forked before any threads start
+    if processes > 1 and not stream:
+        ppool = multiprocessing.Pool(processes)
+    else:
+        ppool = None
+    # download days and games ahead on a thread pool
+    if workers > 1:
+        pool = ThreadPool(workers)
+    else:
+        pool = None
+    depth = 2*max(workers, processes)
+    manifest_init(hdb)
+    pitchfx_migrate(hdb)
+    if bulk:
+        bulk_begin(hdb)
+    elif index_init(hdb):
+        hdb.execute("ANALYZE")
+    writer = PitchfxWriter(db, hdb, commit_every)
+    store = RawStore(root, cache, mirror, offline)
+    try:
+        # only days and games missing from the database
+        days = ingest_plan(hdb, date1, date2, store.root)
+        games = gd2_games(store, days, pool, depth)
+        fetch = lambda game: fetch_game(store, game[2]) if game[1] != None else None
+        if stream:
+            # inning_all.xml is parsed while it downloads, on the download pool
+            fetch = functools.partial(fetch_stream, store=store, parser=parser, skip=writer.has_game)
+            parsed = (((game, raw), rows) for game, (raw, rows) in pool_map(pool, fetch, games, depth))
+        elif ppool != None:
+            parse = functools.partial(parse_fetched, store=store, parser=parser)
+            parsed = pool_map(ppool, parse, pool_map(pool, fetch, games, depth), depth)
+        else:
+            fetched = pool_map(pool, fetch, games, depth)
+            parsed = None
+        if parsed == None:
+            for (date, gg, url_game), raw in fetched:
+                if gg == None:
+                    writer.end_day(date)
+                    continue
+                if fetch_complete(raw):
+                    status, game_id = pitchfx_game(writer, store, date, gg, url_game, raw, pool, parser=parser)
+                else:
+                    status, game_id = 'pending', None
+                writer.mark_game(date, gg, status, game_id)
+                writer.end_game()
+        else:
+            for ((date, gg, url_game), raw), rows in parsed:
+                if gg == None:
+                    writer.end_day(date)
+                    continue
+                if fetch_complete(raw):
+                    status, game_id = write_game(writer, store, gg, url_game, rows, pool, parser)
+                else:
+                    status, game_id = 'pending', None
+                writer.mark_game(date, gg, status, game_id)
+                writer.end_game()
+        writer.flush()
+        season_index(hdb)
+        db.commit()
+    finally:
+        if pool != None:
+            pool.terminate()
+        if ppool != None:
+            ppool.terminate()
+        if bulk:
+            bulk_end(hdb)
+
+
+def pitchfx_game(writer, store, date, gg, url_game, raw, pool=None, stream=False,
+                 parser='tree'):
+    """Add a single downloaded game to database
+
+    Args:
+        writer: PitchfxWriter of the database
+        store: RawStore to read from
+        date: date of the game (yyyymmdd integer)
+        gg: name of the gd2 game directory
+        url_game: url of the gd2 game directory
+        raw: dictionary of raw xml files from fetch_game
+        pool: thread pool used to download player files
+        stream: stream inning_all.xml from url_game instead of raw
+        parser: xml parser, 'tree' (ElementTree) or 'expat' (no tree)
+
+    Returns:
+        Ingest status of the game and its game id from write_game
+    """
+    rows = parse_game(store, date, url_game, raw, stream, parser, writer.has_game)
+    return write_game(writer, store, gg, url_game, rows, pool, parser)
+
+
+def parse_fetched(item, store, stream=False, parser='tree'):
+    """Parse a downloaded game in a worker process
+
+    Args:
+        item: ((date, gg, url_game), raw) pair from the download stage
+        store: RawStore to stream from
+        stream: stream inning_all.xml from url_game instead of raw
+        parser: xml parser, 'tree' (ElementTree) or 'expat' (no tree)
+
+    Returns:
+        Dictionary of rows per table from parse_game
+    """
+    (date, gg, url_game), raw = item
+    if gg == None:
+        return None
+    return parse_game(store, date, url_game, raw, stream, parser)
+
+
+def parse_game(store, date, url_game, raw, stream=False, parser='tree', skip=None):
+    """Parse the raw xml files of a single game into table rows
+
+    Does not touch the database, so it can run in a worker process. Player
+    rows are returned for every player of the game with an unknown dob.
+
+    Args:
+        store: RawStore to stream from
+        date: date of the game (yyyymmdd integer)
+        url_game: url of the gd2 game directory
+        raw: dictionary of raw xml files from fetch_game
+        stream: stream inning_all.xml from url_game instead of raw
+        parser: xml parser, 'tree' (ElementTree) or 'expat' (no tree)
+        skip: function of game id, True if the game is not to be parsed
+
+    Returns:
+        Dictionary of lists of rows per table, with no rows if the game is
+        not to be added, None if game.xml could not be read, STREAM_FAILED
+        if the streamed inning_all.xml could not be read
+    """
+    if parser == 'expat':
+        elements = expat_elements
+    else:
+        elements = tree_elements
+    try:
+        gdict, ginfos = elements(raw['game'], 2)
+    except:
+        return None
+    rows = dict((table, []) for table, insert in INSERTS)
+    game_type = gdict['type']
+    # determine what sort of game it is
+    if game_type not in GTYPES:
+        return rows
+    try:
+        game_id = int(gdict['game_pk'])
+    except:
+        return None
+    # check if game already exists in table
+    if skip != None and skip(game_id):
+        return rows
+    temp_time = gdict['local_game_time']
+    gtime = int(temp_time[0:2]+temp_time[3:5])
+    for tag, ggdict in ginfos:
+        if tag == 'team':
+            if ggdict["type"] == 'home':
+                hid = ggdict['id']
                 try:
-                    url_root = "http://gd2.mlb.com/components/game/mlb/year_%s/month_%s/day_%s" %(year, str(month).zfill(2), str(day).zfill(2))
-                    output = urllib.urlopen(url_root)
+                    tname = ggdict['name_full']
                 except:
-                    day += 1
-                    continue
-                # create list of game ids on given day
-                date = int(str(year).zfill(4)+str(month).zfill(2)+str(day).zfill(2))
-                ggs = []
-                for line in output:
-                    find = str_game.search(line)
-                    if find:
-                        ggs.append(find.group(1))
-
-                # read in game and team information from game url
-                for gg in ggs:
-                    url_game = url_root+"/%s" %(gg)
-                    url = url_game+"/game.xml"
-                    try:
-                        output = urllib.urlopen(url).read()
-                        log = ET.fromstring(output)
-                    except:
-                        continue
-                    gdict = log.attrib
-                    game_type = gdict['type']
-                    # determine what sort of game it is
-                    if game_type not in gtypes:
-                        continue
-                    try:
-                        game_id = int(gdict['game_pk'])
-                        #game_id_prev = game_id
-                    except:
-                        continue
-                    #except:
-                    #    game_id = game_id_prev+1
-                    # check if game already exists in table
-                    comm = "SELECT date FROM games WHERE game_id=%s" %(game_id)
-                    hdb.execute(comm)
-                    if hdb.fetchone() != None:
-                        continue
-                    print gg
-                    temp_time = gdict['local_game_time']
-                    gtime = int(temp_time[0:2]+temp_time[3:5])
-                    for ginfo in log:
-                        if ginfo.tag == 'team':
-                            ggdict = ginfo.attrib
-                            if ggdict["type"] == 'home':
-                                hid = ggdict['id']
-                                try:
-                                    tname = ggdict['name_full']
-                                except:
-                                    tname = ggdict['name']
-                                tid = int(hid)
-                                tabbrv = ggdict['abbrev']
-                                hw = int(ggdict['w'])
-                                hl = int(ggdict['l'])
-                            else:
-                                vid = ggdict['id']
-                                try:
-                                    tname = ggdict['name_full']
-                                except:
-                                    tname = ggdict['name']
-                                tid = int(vid)
-                                tabbrv = ggdict['abbrev']
-                                vw = int(ggdict['w'])
-                                vl = int(ggdict['l'])
-                            # fill in team table
-                            info = (tid, tname, tabbrv)
-                            insert = "INSERT OR IGNORE INTO teams VALUES " \
-                                "(?, ?, ?)"
-                            hdb.execute(insert, info)
-                        # stadium information
-                        elif ginfo.tag == 'stadium':
-                            ggdict = ginfo.attrib
-                            sid = int(ggdict['id'])
-                            sname = ggdict['name']
-                            # fill in stadium table
-                            info = (sid, sname)
-                            insert = "INSERT OR IGNORE INTO stadiums VALUES " \
-                                "(?, ?)"
-                            hdb.execute(insert, info)
-
-                    # read in player info from players xml
-                    url = url_game+'/players.xml'
-                    output = urllib.urlopen(url).read()
-                    log = ET.fromstring(output)
-                    for dinfo in log:
-                        for pinfo in dinfo:
-                            if pinfo.tag == 'player':
-                                try:
-                                    pdict = pinfo.attrib
-                                    player_id = pdict['id']                            
-                                    first = pdict['first']                        
-                                    last = pdict['last']                          
-                                    pos = pdict['position']                                 
-                                    bat = pdict['bats']                                
-                                    throw = pdict['rl'] 
-                                except:
-                                    continue
-                                try:
-                                    info = (player_id, first, last, pos, bat, throw, -1)
-                                    insert = "INSERT INTO players VALUES " \
-                                        "(?, ?, ?, ?, ?, ?, ?)"
-                                    hdb.execute(insert, info)
-                                    dob_flag = 1
-                                except:
-                                    dob_flag = 0
-                                # grab dob from individual player urls
-                                if dob_flag == 1:
-                                    url_player = url_game+'/batters/%s.xml' %(player_id)
-                                    poutput = urllib.urlopen(url_player).read()
-                                    plog = ET.fromstring(poutput)
-                                    ppdict = plog.attrib
-                                    pdob = ppdict['dob']
-                                    yy = pdob[-4:]                                      
-                                    mm = pdob[:2]                                       
-                                    dd = pdob[3:5]                                      
-                                    dob = int(yy+mm+dd)
-                                    # update player table
-                                    comm = "UPDATE players SET dob=%s " \
-                                        "WHERE player_id=%s AND position='%s'" %(dob, player_id, pos)
-                                    hdb.execute(comm)
-                            elif pinfo.tag == 'umpire':
-                                udict = pinfo.attrib
-                                umpire_name = udict['name']
-                                umpire_position = udict['position']
-                                try:
-                                    umpire_id = int(udict['id'])
-                                    # fill in umpires table
-                                    info = (umpire_id, umpire_name)
-                                    insert = "INSERT OR IGNORE INTO umpires VALUES " \
-                                        "(?, ?)"
-                                    hdb.execute(insert, info)
-                                except:
-                                    umpire_id = -1
-                                if umpire_position == 'home':
-                                    u_home = umpire_id
-                                elif umpire_position == 'first':
-                                    u_first = umpire_id
-                                elif umpire_position == 'second':
-                                    u_second = umpire_id
-                                elif umpire_position == 'third':
-                                    u_third = umpire_id
-
-                    # fill in game table if game does not already exist
-                    info = (game_id, game_type, date, gtime, hid, hw, hl, vid, vw, vl, sid, u_home, u_first, u_second, u_third)
-                    insert = "INSERT OR IGNORE INTO games VALUES " \
-                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-                    hdb.execute(insert, info)
-
-                    # read in pitchfx and event tables
-                    url = url_game+"/inning/inning_all.xml"
-                    try:
-                        output = urllib.urlopen(url).read()
-                        log = ET.fromstring(output)
-                    except:
-                        continue
-                    # intialize events and scores
-                    event_id = 0
-                    action_flag = 0
-                    pre_home_score = 0
-                    post_home_score = 0
-                    pre_away_score = 0
-                    post_away_score = 0
-                    # loop over inning
-                    for header in log:
-                        iinfo = header.attrib
-                        inning_num = iinfo['num']
-                        for inning in header:
-                            # new inning flag
-                            inning_flag = 1
-                            post_outs = 0
-                            pre_1b = 0
-                            post_1b = 0
-                            pre_2b = 0
-                            post_2b = 0
-                            pre_3b = 0
-                            post_3b = 0
-                            post_home = 0
-                            if inning.tag == 'top':
-                                is_top = 1
-                            else:
-                                is_top = 0
-                            # loop over events in an inning
-                            for etype in inning:
-                                # keep track of in-game player changes
-                                if etype.tag == 'action':
-                                    edict = etype.attrib
-                                    action_description = edict['des']
-                                    if 'Pinch-Hitter' in action_description:
-                                        action_event = edict['event']
-                                        action_flag = 1
-                                    elif 'Change' in action_description:
-                                        action_event = edict['event']
-                                        action_flag = 1
-                                elif etype.tag == 'atbat':
-                                    pre_outs = post_outs
-                                    # flag for events with multiple runners
-                                    runner_flag = 1
-                                    # reset count at beginning of at-bat
-                                    pre_balls = 0
-                                    post_balls = 0
-                                    pre_strikes = 0
-                                    post_stikes = 0
-                                    edict = etype.attrib
-                                    # to account for strikeouts
-                                    max_strikes = int(edict['s'])
-                                    ab = int(edict['num'])
-                                    pitcher_id = int(edict['pitcher'])
-                                    batter_id = int(edict['batter'])
-                                    end_of_ab_outs = int(edict['o'])
-                                    event_description_ab = edict['event']
-                                    # if there is a previous action then write current ab info as event
-                                    if action_flag == 1:
-                                        info = (game_id, event_id, event_description, inning_num, is_top, pre_outs, post_outs, pitcher_id, batter_id, pre_1b, post_1b, pre_2b, post_2b, pre_3b, post_3b, post_home, pre_home_score, post_home_score, pre_away_score, post_away_score)
-                                        insert = "INSERT OR IGNORE INTO events VALUES (" \
-                                            "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                            "?, ?, ? ,?, ?, ?, ?, ?, ?, ?" \
-                                            ")"
-                                        hdb.execute(insert, info)
-                                        event_id += 1
-                                    #if inning_flag == 1:
-                                    #    event_id += 1
-                                    #    info = (game_id, event_id, -1, inning_num, is_top, pre_outs, post_outs, pitcher_id, batter_id, -1, -1, -1, pre_home_score, post_home_score, pre_away_score, post_away_score)
-                                    #    insert = "INSERT OR IGNORE INTO events VALUES (" \
-                                    #         "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                    #         "?, ?, ?, ?, ?, ?" \
-                                    #         ")"
-                                    #    hdb.execute(insert, info)
-                                    try:
-                                        pre_home_score = post_home_score
-                                        pre_away_score = post_away_score
-                                        post_home_score = edict['home_team_runs']
-                                        post_away_score = edict['away_team_runs']
-                                    except:
-                                        pass
-                                    # reset inning and action flag
-                                    action_flag = 0
-                                    inning_flag = 0
-                                    runner_flag = 0
-                                    # read in pitches
-                                    for event in etype:
-                                        # update runners if necessary
-                                        if (event.tag != "runner") and (runner_flag == 0):
-                                            pre_1b = post_1b
-                                            pre_2b = post_2b
-                                            pre_3b = post_3b
-                                            post_home = 0
-                                            event_id += 1
-                                        # registered pitch
-                                        if event.tag == 'pitch':
-                                            runner_flag = 1
-                                            # initialize pitchfx list and read in basic info
-                                            info = list(pfxinit)
-                                            info[pfxkeys['game_id']] = game_id
-                                            info[pfxkeys['at_bat']] = ab
-                                            info[pfxkeys['cur_event']] = event_id
-                                            idict = event.attrib
-                                            try:
-                                                time_stamp = int(idict['sv_id'][-6:])
-                                                info[pfxkeys['time']] = time_stamp
-                                            except:
-                                                pass
-                                            # only fill in pitchfx info that exist
-                                            common = set(idict.keys()).intersection(pfxkeys)
-                                            for pfxvars in common:
-                                                info[pfxkeys[pfxvars]] = idict[pfxvars]
-                                            # update balls and strikes information
-                                            if idict['type'] == 'B':
-                                                post_balls = min(pre_balls+1,4)
-                                                post_strikes = pre_strikes
-                                            elif idict['type'] == 'S':
-                                                post_balls = pre_balls
-                                                if idict['des'] == 'Foul':
-                                                    post_strikes = min(pre_strikes+1,2)
-                                                else:
-                                                    post_strikes = min(pre_strikes+1,max_strikes)
-                                            else:
-                                                post_balls = pre_balls
-                                                post_strikes = pre_strikes
-                                            info[pfxkeys['pre_balls']] = pre_balls
-                                            info[pfxkeys['post_balls']] = post_balls
-                                            info[pfxkeys['pre_strikes']] = pre_strikes
-                                            info[pfxkeys['post_strikes']] = post_strikes
-                                            # fill in pitchfx table
-                                            insert = "INSERT OR IGNORE INTO pitchfx VALUES (" \
-                                                "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                                "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                                "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                                "?, ?, ?, ?, ?, ?" \
-                                                ")"
-                                            hdb.execute(insert, info)
-                                            # update balls and strikes again
-                                            pre_balls = post_balls
-                                            pre_strikes = post_strikes
-                                        # initialize runner events(s)
-                                        elif (event.tag == 'runner'):
-                                            rdict = event.attrib
-                                            runner_id = rdict['id']
-                                            event_description = rdict['event']
-                                            base_start = rdict['start']
-                                            flag1 = 0
-                                            flag2 = 0
-                                            flag3 = 0
-                                            if base_start == "1B":
-                                               pre_1b = runner_id
-                                               flag1 = 1
-                                            elif base_start == "2B":
-                                               pre_2b = runner_id
-                                               flag2 = 1
-                                            elif base_start == "3B":
-                                               pre_3b = runner_id
-                                               flag3 = 1
-                                            #if base_start == "":
-                                            #    base_start = "H"
-                                            base_end = rdict['end']
-                                            if base_end == "":
-                                                try:
-                                                    if rdict['score'] == "T":
-                                                        #base_end = "H"
-                                                        post_home = runner_id
-                                                except:
-                                                    #base_end = "0"
-                                                    post_outs = pre_outs+1
-                                            elif base_end == "1B":
-                                               post_1b = runner_id
-                                            elif base_end == "2B":
-                                               post_2b = runner_id
-                                            elif base_end == "3B":
-                                               post_3b = runner_id
-                                            if base_start != base_end:
-                                                if flag1 == 1:
-                                                   post_1b = 0
-                                                elif flag2 == 1:
-                                                   post_2b = 0
-                                                elif flag3 == 1:
-                                                   post_3b = 0
-                                            # fill in event table
-                                            info = (game_id, event_id, event_description, inning_num, is_top, pre_outs, post_outs, pitcher_id, batter_id, pre_1b, post_1b, pre_2b, post_2b, pre_3b, post_3b, post_home, pre_home_score, post_home_score, pre_away_score, post_away_score)
-                                            insert = "INSERT OR REPLACE INTO events VALUES (" \
-                                                   "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                                   "?, ?, ?, ?, ?, ?, ?, ?, ?, ?" \
-                                                   ")"
-                                            hdb.execute(insert, info)
-                                            ## update event id if necessary
-                                            #if runner_flag == 1:
-                                            #    event_id += 1
-                                            # upcoming runner tags are not separate events
-                                            runner_flag = 0
-                                        # handle pitch-outs
-                                        elif event.tag == 'po':
-                                            runner_flag = 1
-                                            rdict = event.attrib
-                                            event_description = rdict['des']
-                                            # fill in event table
-                                            info = (game_id, event_id, event_description, inning_num, is_top, pre_outs, post_outs, pitcher_id, batter_id, pre_1b, post_1b, pre_2b, post_2b, pre_3b, post_3b, post_home, pre_home_score, post_home_score, pre_away_score, post_away_score)
-                                            insert = "INSERT OR IGNORE INTO events VALUES (" \
-                                                "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                                "?, ?, ?, ?, ?, ?, ?, ?, ?, ?" \
-                                                ")"                             
-                                            hdb.execute(insert, info)
-                                            event_id += 1
-                                    # add end of at-bat information only if an out
-                                    if end_of_ab_outs > pre_outs:
-                                        # if last entry in ab is not runner then there was nobody on base (new event)
-                                        # fill in event table
-                                        info = (game_id, event_id, event_description_ab, inning_num, is_top, pre_outs, end_of_ab_outs, pitcher_id, batter_id, pre_1b, post_1b, pre_2b, post_2b, pre_3b, post_3b, post_home, pre_home_score, post_home_score, pre_away_score, post_away_score)
-                                        #info = (game_id, event_id, event_description_ab, inning_num, is_top, pre_outs, end_of_ab_outs, pitcher_id, batter_id, batter_id, 'H', '0', pre_home_score, post_home_score, pre_away_score, post_away_score)
-                                        insert = "INSERT OR REPLACE INTO events VALUES (" \
-                                            "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, " \
-                                            "?, ?, ?, ?, ?, ?, ?, ?, ?, ?" \
-                                            ")"                             
-                                        hdb.execute(insert, info)
-                                        #if event.tag != 'runner':
-                                        #    event_id += 1
-                                        # update outs
-                                        pre_outs = end_of_ab_outs
-                                        post_outs = end_of_ab_outs
-                                        # if last entry in ab is runner then there was someone on base (already registered as event)
-                                        #if event.tag == 'runner':
-                                        #    event_id += 1
-                    ## temporary break from games
-                    # commit game
-                    db.commit()
-                    #return
-                # check whether to break out
-                #if date >= date_end:
-                if date >= date_end:
-                    return
-                # update day
-                day += 1
-            # update day and month
-            day = 1
-            month += 1
-        # reset month
-        month = 1
+                    tname = ggdict['name']
+                tid = int(hid)
+                tabbrv = ggdict['abbrev']
+                hw = int(ggdict['w'])
+                hl = int(ggdict['l'])
+            else:
+                vid = ggdict['id']
+                try:
+                    tname = ggdict['name_full']
+                except:
+                    tname = ggdict['name']
+                tid = int(vid)
+                tabbrv = ggdict['abbrev']
+                vw = int(ggdict['w'])
+                vl = int(ggdict['l'])
+            # fill in team table
+            rows['teams'].append((tid, tname, tabbrv))
+        # stadium information
+        elif tag == 'stadium':
+            sid = int(ggdict['id'])
+            sname = ggdict['name']
+            # fill in stadium table
+            rows['stadiums'].append((sid, sname))
+
+    # read in player info from players xml
+    pinfos = elements(raw['players'], 3)[1]
+    u_home = u_first = u_second = u_third = -1
+    for tag, pdict in pinfos:
+        if tag == 'player':
+            try:
+                player_id = pdict['id']
+                first = pdict['first']
+                last = pdict['last']
+                pos = pdict['position']
+                bat = pdict['bats']
+                throw = pdict['rl']
+            except:
+                continue
+            rows['players'].append([player_id, first, last, pos, bat, throw, -1])
+        elif tag == 'umpire':
+            umpire_name = pdict['name']
+            umpire_position = pdict['position']
+            try:
+                umpire_id = int(pdict['id'])
+                # fill in umpires table
+                rows['umpires'].append((umpire_id, umpire_name))
+            except:
+                umpire_id = -1
+            if umpire_position == 'home':
+                u_home = umpire_id
+            elif umpire_position == 'first':
+                u_first = umpire_id
+            elif umpire_position == 'second':
+                u_second = umpire_id
+            elif umpire_position == 'third':
+                u_third = umpire_id
+
+    # fill in game table if game does not already exist
+    info = (game_id, game_type, date, gtime, hid, hw, hl, vid, vw, vl, sid, u_home, u_first, u_second, u_third)
+    rows['games'].append(info)
+
+    # read in pitchfx and event tables
+    state = InningState(game_id)
+    if stream:
+        try:
+            source = store.open(url_game+"/inning/inning_all.xml")
+        except:
+            return STREAM_FAILED
+        try:
+            if parser == 'expat':
+                expat_parse(InningHandler(state), source)
+            else:
+                inning_stream(state, source)
+        except (IOError, VET.ParseError, expat.ExpatError):
+            return STREAM_FAILED
+        finally:
+            source.close()
+    elif parser == 'expat':
+        try:
+            expat_parse(InningHandler(state), raw['inning'])
+        except (TypeError, expat.ExpatError):
+            return rows
+    else:
+        try:
+            log = ET.fromstring(raw['inning'])
+        except:
+            return rows
+        inning_tree(state, log)
+    rows['events'] = state.events.values()
+    rows['pitchfx'] = state.pitch_rows()
+    return rows
+
+
+def write_game(writer, store, gg, url_game, rows, pool=None, parser='tree'):
+    """Write the parsed rows of a single game to database
+
+    Args:
+        writer: PitchfxWriter of the database
+        store: RawStore to read player files from
+        gg: name of the gd2 game directory
+        url_game: url of the gd2 game directory
+        rows: dictionary of rows per table from parse_game
+        pool: thread pool used to download player files
+        parser: xml parser, 'tree' (ElementTree) or 'expat' (no tree)
+
+    Returns:
+        Ingest status of the game (pending, fetched, committed or skipped)
+        and its game id
+    """
+    if rows == None:
+        return 'fetched', None
+    if rows == STREAM_FAILED:
+        return 'pending', None
+    if not rows['games']:
+        return 'skipped', None
+    # check if game already exists in table
+    game_id = rows['games'][0][0]
+    if writer.has_game(game_id):
+        return 'committed', game_id
+    print gg
+    if parser == 'expat':
+        elements = expat_elements
+    else:
+        elements = tree_elements
+
+    # newly added (player_id, position) pairs
+    new_players = []
+    for info in rows['players']:
+        if not writer.has_player(info[0], info[3]):
+            writer.add('players', info)
+            new_players.append(info)
+
+    # grab dob from individual player urls of player ids never seen before
+    player_ids = sorted(set(int(info[0]) for info in new_players) - set(writer.dobs))
+    urls = [url_game+'/batters/%s.xml' %(player_id) for player_id in player_ids]
+    poutputs = pool_map(pool, store.read, urls, len(urls))
+    for player_id, (url_player, poutput) in zip(player_ids, poutputs):
+        ppdict = elements(poutput, 1)[0]
+        pdob = ppdict['dob']
+        yy = pdob[-4:]
+        mm = pdob[:2]
+        dd = pdob[3:5]
+        writer.dobs[player_id] = int(yy+mm+dd)
+    # update player rows before they are written
+    for info in new_players:
+        info[6] = writer.dobs[int(info[0])]
+
+    # fill in the remaining tables
+    for table, insert in INSERTS:
+        if table != 'players':
+            for info in rows[table]:
+                writer.add(table, info)
+    return 'committed', game_id
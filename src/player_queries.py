@@ -0,0 +1,119 @@
+#----------------------------------------------------
+# player_queries.py
+#
+# sql templates of the Player queries, shared by
+# Player (python 3) and index_pitchfx.py (python 2)
+#----------------------------------------------------
+
+# ids of a player name
+PLAYER_IDS = """SELECT DISTINCT player_id
+        FROM players
+        WHERE player_first=?
+            AND player_last=?
+        ORDER BY player_id"""
+
+# player queries, formatted with ids of one ? placeholder per player id
+INFO = """SELECT *
+        FROM players
+        WHERE player_id IN (%(ids)s)"""
+
+PITCH_GAMES = """SELECT DISTINCT games.*
+        FROM games
+        JOIN events ON (games.game_id=events.game_id)
+        WHERE events.pitcher_id IN (%(ids)s)
+        ORDER BY games.game_id"""
+
+HIT_GAMES = """SELECT DISTINCT games.*
+        FROM games
+        JOIN events ON (games.game_id=events.game_id)
+        WHERE events.batter_id IN (%(ids)s)
+        ORDER BY games.game_id"""
+
+# pitchfx columns returned for pitches, without the event columns stored
+# on each pitch (pitcher_id, batter_id, inning, ...)
+PITCHFX_COLUMNS = """game_id, pitch_num, at_bat, time, cur_event,
+        description, outcome, pre_balls, post_balls, pre_strike, post_strike,
+        start_speed, end_speed, sz_top, sz_bot, pfx_x, pfx_z, px, pz, x, y,
+        x0, y0, z0, vx0, vy0, vz0, ax, ay, az, break_y, break_angle,
+        break_length, spin_dir, spin_rate, pitch_type"""
+
+# columns that pitches can return besides the default ones
+PITCHFX_EVENT_COLUMNS = ["pitcher_id", "batter_id", "inning", "is_top_inning",
+        "pre_out", "pre_1b", "pre_2b", "pre_3b"]
+
+# pitch queries, also formatted with the columns and filters of pitch_fields
+PITCHES = """SELECT %(columns)s
+        FROM pitchfx
+        WHERE pitcher_id IN (%(ids)s)%(filters)s
+        ORDER BY game_id, pitch_num"""
+
+PITCHES_AGAINST = """SELECT %(columns)s
+        FROM pitchfx
+        WHERE batter_id IN (%(ids)s)%(filters)s
+        ORDER BY game_id, pitch_num"""
+
+PITCH_EVENTS = """SELECT DISTINCT *
+        FROM events
+        WHERE pitcher_id IN (%(ids)s)
+        ORDER BY game_id, event_id"""
+
+HIT_EVENTS = """SELECT DISTINCT *
+        FROM events
+        WHERE batter_id IN (%(ids)s)
+        ORDER BY game_id, event_id"""
+
+# batch queries, joined to the ids in the temporary batch_players table
+# and sorted by the player id in batch_id
+BATCH_TABLE = """CREATE TEMP TABLE IF NOT EXISTS batch_players (
+        player_id INTEGER PRIMARY KEY)"""
+
+BATCH_INFO = """SELECT players.player_id AS batch_id, players.*
+        FROM batch_players
+        JOIN players ON (players.player_id=batch_players.player_id)
+        ORDER BY batch_id"""
+
+BATCH_PITCH_GAMES = """SELECT DISTINCT events.pitcher_id AS batch_id, games.*
+        FROM batch_players
+        JOIN events ON (events.pitcher_id=batch_players.player_id)
+        JOIN games ON (games.game_id=events.game_id)
+        ORDER BY batch_id, games.game_id"""
+
+BATCH_HIT_GAMES = """SELECT DISTINCT events.batter_id AS batch_id, games.*
+        FROM batch_players
+        JOIN events ON (events.batter_id=batch_players.player_id)
+        JOIN games ON (games.game_id=events.game_id)
+        ORDER BY batch_id, games.game_id"""
+
+BATCH_PITCHES = """SELECT pitchfx.pitcher_id AS batch_id, %(columns)s
+        FROM batch_players, pitchfx
+        WHERE pitchfx.pitcher_id=batch_players.player_id%(filters)s
+        ORDER BY batch_id, game_id, pitch_num"""
+
+BATCH_PITCHES_AGAINST = """SELECT pitchfx.batter_id AS batch_id, %(columns)s
+        FROM batch_players, pitchfx
+        WHERE pitchfx.batter_id=batch_players.player_id%(filters)s
+        ORDER BY batch_id, game_id, pitch_num"""
+
+BATCH_PITCH_EVENTS = """SELECT DISTINCT events.pitcher_id AS batch_id, events.*
+        FROM batch_players
+        JOIN events ON (events.pitcher_id=batch_players.player_id)
+        ORDER BY batch_id, game_id, event_id"""
+
+BATCH_HIT_EVENTS = """SELECT DISTINCT events.batter_id AS batch_id, events.*
+        FROM batch_players
+        JOIN events ON (events.batter_id=batch_players.player_id)
+        ORDER BY batch_id, game_id, event_id"""
+
+# queries described by Player.query_plans and index_pitchfx.py
+QUERIES = [
+    ('info', INFO),
+    ('pitch_games', PITCH_GAMES),
+    ('hit_games', HIT_GAMES),
+    ('pitches', PITCHES),
+    ('pitches_against', PITCHES_AGAINST),
+    ('pitch_events', PITCH_EVENTS),
+    ('hit_events', HIT_EVENTS),
+    ]
+
+# fields of the pitch queries without options (see pitch_fields in Player)
+PITCH_FIELDS = {"columns": PITCHFX_COLUMNS, "filters": ""}
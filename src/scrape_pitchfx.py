@@ -13,6 +13,7 @@
 import sys
 import os
 import re
+import getopt
 import sqlite3
 import load_pitchfx_mod as pm
 
@@ -20,18 +21,60 @@ import load_pitchfx_mod as pm
 #----------------------------------------------------
 # kernel
 #----------------------------------------------------
+# grab options
+longopts = ["workers=", "processes=", "stream", "parser=", "cache=",
+    "mirror=", "offline", "bulk"]
+try:
+    opts, args = getopt.gnu_getopt(sys.argv[1:], "", longopts)
+except getopt.GetoptError:
+    opts, args = [], []
+workers = 1
+processes = 1
+stream = False
+parser = "tree"
+cache = None
+mirror = None
+offline = False
+bulk = False
+for opt, val in opts:
+    if opt == "--workers":
+        workers = max(int(val), 1)
+    elif opt == "--processes":
+        processes = max(int(val), 1)
+    elif opt == "--stream":
+        stream = True
+    elif opt == "--parser":
+        parser = val
+    elif opt == "--cache":
+        cache = val
+    elif opt == "--mirror":
+        mirror = val
+    elif opt == "--offline":
+        offline = True
+    elif opt == "--bulk":
+        bulk = True
+
 # check number of arguments
-if len(sys.argv) < 5:
+if len(args) < 4:
     print "Usage:"
-    print "    %s [begin date] [end date] [name of db] [prompt?]" %(sys.argv[0])
+    print "    %s [begin date] [end date] [name of db] [prompt?] [--workers N] [--processes N] [--stream] [--parser tree|expat]" %(sys.argv[0])
+    print "        [--cache DIR] [--mirror DIR] [--offline] [--bulk]"
     print " date format: mm-dd-yyyy"
+    print " --workers: number of download threads (default 1)"
+    print " --processes: number of parsing processes (default 1, not used with --stream)"
+    print " --stream: parse inning files while they download, on the download threads"
+    print " --parser: tree (ElementTree, default) or expat (no tree, faster)"
+    print " --cache: directory of compressed raw xml shared between runs"
+    print " --mirror: local copy of the gd2 tree to read instead of http"
+    print " --offline: read from the cache only (needs --cache)"
+    print " --bulk: faster backfill, builds indexes once at the end"
     sys.exit()
 
 # grab variables
-bdate = sys.argv[1]
-edate = sys.argv[2]
-dbname = sys.argv[3]
-prompt = bool(sys.argv[4])
+bdate = args[0]
+edate = args[1]
+dbname = args[2]
+prompt = bool(args[3])
 
 # parse beginning and end dates
 date = re.compile("^(\d\d)-(\d\d)-(\d\d\d\d)$")       
@@ -57,6 +100,10 @@ edate = int('%s%s%s' %(eyear, emonth, eday))
 if edate < bdate:         
     print "Need begin date to be earlier than end date"
     sys.exit()
+# offline reads come from the cache
+if offline and cache == None and mirror == None:
+    print "--offline needs --cache"
+    sys.exit()
 
 # touch sqlite3 database
 if os.path.isfile(dbname) is False:
@@ -72,7 +119,9 @@ else:
   
 
 # add information to database
-pm.pitchfx_add(db, hdb, bdate, edate, prompt)
+pm.pitchfx_add(db, hdb, bdate, edate, prompt, workers, stream=stream,
+               parser=parser, processes=processes, cache=cache, mirror=mirror,
+               offline=offline, bulk=bulk)
 
 # clean up
 db.commit()
@@ -0,0 +1,29 @@
+#----------------------------------------------------
+# bench_inning_parse.py
+#
+# throughput of the inning_all.xml parsers of
+# load_pitchfx_mod on the gd2 files in fixtures/gd2
+#
+#   python tests/bench_inning_parse.py [repeat]
+#----------------------------------------------------
+import os
+import sys
+import time
+from test_load_parsers import GAMES, read, parse_tree, parse_stream, parse_expat, parse_expat_stream
+
+
+def main(repeat):
+    paths = [os.path.join(game, "inning", "inning_all.xml") for game in GAMES]
+    size = sum(len(read(path)) for path in paths)*repeat/1e6
+    print "%d files, %.1f MB per parser" %(len(paths), size)
+    for parse in [parse_tree, parse_stream, parse_expat, parse_expat_stream]:
+        start = time.time()
+        for ii in range(repeat):
+            for path in paths:
+                parse(path)
+        elapsed = time.time()-start
+        print "%-20s %6.2f s %6.1f MB/s" %(parse.__name__, elapsed, size/elapsed)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
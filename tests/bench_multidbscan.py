@@ -0,0 +1,50 @@
+#----------------------------------------------------
+# bench_multidbscan.py
+#
+# run time of MultiDBSCAN (k=10, var=2) on 3-d
+# gaussian mixtures of 10k, 100k and 1M points, with
+# the recursive engine it replaced up to 100k points
+#
+#   python3 tests/bench_multidbscan.py [largest size]
+#----------------------------------------------------
+import sys
+import time
+from test_multidbscan import MultiDBSCAN, RecursiveMultiDBSCAN, mixture
+
+SIZES = [10000, 100000, 1000000]
+
+# largest input run through the recursive engine
+RECURSIVE_MAX = 100000
+
+
+def timed(engine, X):
+    """Seconds to fit an engine and its clusters, None if it fails"""
+    start = time.time()
+    try:
+        clusters = engine(10, 2).fit_predict(X)
+    except RecursionError:
+        return None, None
+    return time.time()-start, clusters
+
+
+def main(largest):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(10000)
+    print("  points  clusters  clustered  iterative  recursive")
+    for npoints in SIZES:
+        if npoints > largest:
+            break
+        X = mixture(npoints, 0)
+        elapsed, clusters = timed(MultiDBSCAN, X)
+        nclustered = sum(len(cluster) for cluster in clusters.values())
+        if npoints <= RECURSIVE_MAX:
+            old = timed(RecursiveMultiDBSCAN, X)
+            old = "RecursionError" if old[0] is None else "%8.1f s" %(old[0])
+        else:
+            old = "-"
+        print("%8d  %8d  %9d  %7.1f s  %s" %(npoints, len(clusters), nclustered, elapsed, old))
+    sys.setrecursionlimit(limit)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1])
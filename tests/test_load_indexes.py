@@ -0,0 +1,71 @@
+#----------------------------------------------------
+# test_load_indexes.py
+#
+# query plans of the Player queries before and after
+# index_init of load_pitchfx_mod, on the gd2 files in
+# fixtures/gd2 (python 2, like the loader)
+#----------------------------------------------------
+import StringIO
+import os
+import sqlite3
+import sys
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, "..", "src"))
+import load_pitchfx_mod as pm
+import player_queries as pq
+
+# local gd2 tree of a single day
+FIXTURE = os.path.join(TESTS, "fixtures", "gd2")
+
+# index searched by each query filtering on a player id
+SEARCHES = {
+    'pitch_games': 'events_pitcher',
+    'hit_games': 'events_batter',
+    'pitches': 'pitchfx_pitcher',
+    'pitches_against': 'pitchfx_batter',
+    'pitch_events': 'events_pitcher',
+    'hit_events': 'events_batter',
+    }
+
+
+class IndexPlanTest(unittest.TestCase):
+    """The secondary indexes turn the scans of the Player queries into searches"""
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.hdb = self.db.cursor()
+        pm.pitchfx_init(self.hdb)
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            pm.pitchfx_add(self.db, self.hdb, 20080402, 20080402, 0, mirror=FIXTURE)
+        finally:
+            sys.stdout = stdout
+        for name, table, columns in pm.INDEXES:
+            self.hdb.execute("DROP INDEX %s" %(name))
+
+    def tearDown(self):
+        self.db.close()
+
+    def plans(self):
+        return dict((name, " ".join(pm.query_plan(self.hdb, query %dict(pq.PITCH_FIELDS, ids="?"), (0,))))
+                    for name, query in pq.QUERIES)
+
+    def test_plans(self):
+        self.assertEqual(sorted(pm.index_check(self.hdb)), sorted(name for name, table, columns in pm.INDEXES))
+        before = self.plans()
+        for name, index in SEARCHES.items():
+            self.assertNotIn(index, before[name])
+        self.assertEqual(sorted(pm.index_init(self.hdb)), sorted(name for name, table, columns in pm.INDEXES))
+        self.assertEqual(pm.index_check(self.hdb), [])
+        after = self.plans()
+        for name, index in SEARCHES.items():
+            self.assertIn("SEARCH", after[name])
+            self.assertIn(index, after[name])
+        names = " ".join(pm.query_plan(self.hdb, pq.PLAYER_IDS, ("first", "last")))
+        self.assertIn("players_name", names)
+
+
+if __name__ == "__main__":
+    unittest.main()
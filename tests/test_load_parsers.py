@@ -0,0 +1,94 @@
+#----------------------------------------------------
+# test_load_parsers.py
+#
+# parity of the tree, streaming and expat parsers of
+# load_pitchfx_mod on the gd2 files in fixtures/gd2
+# (python 2, like the loader)
+#----------------------------------------------------
+import glob
+import os
+import sys
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, "..", "src"))
+import load_pitchfx_mod as pm
+
+# local gd2 tree of a single day
+FIXTURE = os.path.join(TESTS, "fixtures", "gd2")
+GAMES = sorted(glob.glob(os.path.join(FIXTURE, "year_*", "month_*", "day_*", "gid_*")))
+
+
+def read(path):
+    """Contents of a fixture file"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def parse_tree(path):
+    """InningState of inning_all.xml read by ElementTree"""
+    state = pm.InningState(1)
+    pm.inning_tree(state, pm.ET.fromstring(read(path)))
+    return state
+
+
+def parse_stream(path):
+    """InningState of inning_all.xml streamed by iterparse"""
+    state = pm.InningState(1)
+    with open(path, 'rb') as source:
+        pm.inning_stream(state, source)
+    return state
+
+
+def parse_expat(path):
+    """InningState of inning_all.xml read by the expat handler"""
+    state = pm.InningState(1)
+    pm.expat_parse(pm.InningHandler(state), read(path))
+    return state
+
+
+def parse_expat_stream(path):
+    """InningState of inning_all.xml streamed to the expat handler"""
+    state = pm.InningState(1)
+    with open(path, 'rb') as source:
+        pm.expat_parse(pm.InningHandler(state), source)
+    return state
+
+
+class InningParityTest(unittest.TestCase):
+    """Every parser fills the same InningState"""
+    def test_fixture(self):
+        self.assertTrue(GAMES)
+
+    def test_innings(self):
+        for game in GAMES:
+            path = os.path.join(game, "inning", "inning_all.xml")
+            tree = parse_tree(path)
+            self.assertTrue(tree.pitches)
+            self.assertTrue(tree.events)
+            for parse in [parse_stream, parse_expat, parse_expat_stream]:
+                state = parse(path)
+                self.assertEqual(state.pitches, tree.pitches, "%s %s" %(parse.__name__, game))
+                self.assertEqual(state.events, tree.events, "%s %s" %(parse.__name__, game))
+                self.assertEqual(state.pitch_rows(), tree.pitch_rows(), "%s %s" %(parse.__name__, game))
+
+    def test_elements(self):
+        for game in GAMES:
+            for name, depth in [("game.xml", 2), ("players.xml", 3)]:
+                data = read(os.path.join(game, name))
+                self.assertEqual(pm.expat_elements(data, depth), pm.tree_elements(data, depth))
+
+    def test_games(self):
+        for game in GAMES:
+            raw = pm.fetch_game(pm.RawStore(mirror=FIXTURE), game)
+            tree = pm.parse_game(None, 20080402, game, raw)
+            self.assertEqual(pm.parse_game(None, 20080402, game, raw, parser='expat'), tree)
+            store = pm.RawStore(mirror=FIXTURE)
+            for parser in ['tree', 'expat']:
+                rows = pm.parse_game(store, 20080402, game, {'game': raw['game'], 'players': raw['players']},
+                                     stream=True, parser=parser)
+                self.assertEqual(rows, tree)
+
+
+if __name__ == "__main__":
+    unittest.main()
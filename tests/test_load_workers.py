@@ -0,0 +1,156 @@
+#----------------------------------------------------
+# test_load_workers.py
+#
+# loads the gd2 files in fixtures/gd2 from a local
+# http server with one and several download threads
+# (python 2, like the loader)
+#----------------------------------------------------
+import BaseHTTPServer
+import SimpleHTTPServer
+import SocketServer
+import StringIO
+import os
+import posixpath
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, "..", "src"))
+import load_pitchfx_mod as pm
+
+# local gd2 tree of a single day
+FIXTURE = os.path.join(TESTS, "fixtures", "gd2")
+DATE = 20080402
+
+# delay of every response, so downloads overlap with several workers
+LATENCY = 0.02
+
+TABLES = ["games", "teams", "stadiums", "players", "umpires", "events", "pitchfx", "ingest_manifest"]
+
+
+class FixtureHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Serve the tree under the root of the server with a fixed latency"""
+    def translate_path(self, path):
+        path = posixpath.normpath(urllib.unquote(path.split('?', 1)[0].split('#', 1)[0]))
+        return os.path.join(self.server.root, *[part for part in path.split('/') if part not in ('', '.', '..')])
+
+    def send_head(self):
+        time.sleep(LATENCY)
+        return SimpleHTTPServer.SimpleHTTPRequestHandler.send_head(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server answering every request on its own thread"""
+    daemon_threads = True
+    root = FIXTURE
+
+
+def load(dbname=":memory:", **kwargs):
+    """Load the fixture day into a database, in memory by default
+
+    Returns:
+        Dictionary of sorted rows per table
+    """
+    new = not os.path.isfile(dbname)
+    db = sqlite3.connect(dbname)
+    hdb = db.cursor()
+    if new:
+        pm.pitchfx_init(hdb)
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        pm.pitchfx_add(db, hdb, DATE, DATE, 0, **kwargs)
+    finally:
+        sys.stdout = stdout
+    tables = dict((table, sorted(hdb.execute("SELECT * FROM %s" %(table)).fetchall())) for table in TABLES)
+    db.close()
+    return tables
+
+
+class WorkersTest(unittest.TestCase):
+    """Several download threads load the same rows as one"""
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadedServer(("127.0.0.1", 0), FixtureHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.root = "http://127.0.0.1:%d" %(cls.server.server_address[1])
+        cls.mirror = load(mirror=FIXTURE)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_mirror(self):
+        self.assertEqual(len(self.mirror["games"]), 2)
+        self.assertTrue(self.mirror["pitchfx"])
+        self.assertTrue(all(row[6] > 0 for row in self.mirror["players"]))
+
+    def test_workers(self):
+        for workers in [1, 4]:
+            self.assertEqual(load(workers=workers, root=self.root), self.mirror, "workers=%d" %(workers))
+            self.assertEqual(load(workers=workers, root=self.root, stream=True), self.mirror,
+                             "workers=%d stream" %(workers))
+
+    def test_processes(self):
+        self.assertEqual(load(workers=4, processes=2, root=self.root), self.mirror)
+
+    def test_missing_inning(self):
+        # a game whose inning_all.xml cannot be read stays pending, also
+        # when it is streamed, and is loaded by the next run
+        tmpdir = tempfile.mkdtemp()
+        try:
+            tree = os.path.join(tmpdir, "gd2")
+            shutil.copytree(FIXTURE, tree)
+            game = sorted(os.listdir(os.path.join(tree, "year_2008", "month_04", "day_02")))[0]
+            inning = os.path.join(tree, "year_2008", "month_04", "day_02", game, "inning", "inning_all.xml")
+            os.rename(inning, inning+".bak")
+            self.server.root = tree
+            missing = load(mirror=tree)
+            self.assertEqual(load(workers=4, root=self.root), missing)
+            self.assertIn((DATE, '', None, 'pending'), missing["ingest_manifest"])
+            self.assertIn((DATE, game, None, 'pending'), missing["ingest_manifest"])
+            self.assertEqual(len(missing["games"]), 1)
+            for stream in [{"mirror": tree}, {"root": self.root},
+                           {"root": self.root, "parser": "expat"}, {"root": self.root, "processes": 2}]:
+                dbname = os.path.join(tmpdir, "stream.db")
+                self.assertEqual(load(dbname, workers=4, stream=True, **stream), missing, repr(stream))
+                os.rename(inning+".bak", inning)
+                self.assertEqual(load(dbname, workers=4, stream=True, **stream), self.mirror, repr(stream))
+                os.rename(inning, inning+".bak")
+                os.remove(dbname)
+        finally:
+            self.server.root = FIXTURE
+            shutil.rmtree(tmpdir)
+
+    def test_error_pages(self):
+        # http errors are not cached and leave no manifest row of the day
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = os.path.join(tmpdir, "cache")
+            self.server.root = os.path.join(tmpdir, "empty")
+            tables = load(workers=4, root=self.root, cache=cache)
+            self.assertEqual(tables["ingest_manifest"], [])
+            self.assertFalse(os.path.exists(cache) and os.listdir(cache))
+            self.server.root = FIXTURE
+            self.assertEqual(load(workers=4, root=self.root, cache=cache), self.mirror)
+            self.assertEqual(load(root=self.root, cache=cache, offline=True), self.mirror)
+            self.assertRaises(ValueError, load, root=self.root, offline=True)
+        finally:
+            self.server.root = FIXTURE
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
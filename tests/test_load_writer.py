@@ -0,0 +1,49 @@
+#----------------------------------------------------
+# test_load_writer.py
+#
+# ingest version kept by PitchfxWriter of
+# load_pitchfx_mod (python 2, like the loader)
+#----------------------------------------------------
+import os
+import sqlite3
+import sys
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, "..", "src"))
+import load_pitchfx_mod as pm
+
+
+class WriterVersionTest(unittest.TestCase):
+    """Only rows of data tables change the ingest version"""
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.hdb = self.db.cursor()
+        pm.pitchfx_init(self.hdb)
+        pm.manifest_init(self.hdb)
+        self.writer = pm.PitchfxWriter(self.db, self.hdb)
+
+    def tearDown(self):
+        self.db.close()
+
+    def version(self):
+        return self.hdb.execute("SELECT version FROM ingest_version").fetchone()[0]
+
+    def test_manifest_only(self):
+        self.writer.mark_game(20080402, 'gid_2008_04_02_lamlb_sfmlb_1', 'pending')
+        self.writer.end_day(20080402)
+        self.writer.flush()
+        self.assertEqual(self.version(), 0)
+        self.assertEqual(self.hdb.execute("SELECT count(*) FROM ingest_manifest").fetchone()[0], 2)
+
+    def test_data_rows(self):
+        self.writer.add('teams', (137, 'San Francisco Giants', 'SF'))
+        self.writer.mark_game(20080402, 'gid_2008_04_02_lamlb_sfmlb_1', 'committed', 233006)
+        self.writer.flush()
+        self.assertEqual(self.version(), 1)
+        self.writer.flush()
+        self.assertEqual(self.version(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
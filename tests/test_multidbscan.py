@@ -0,0 +1,93 @@
+#----------------------------------------------------
+# test_multidbscan.py
+#
+# parity of the iterative MultiDBSCAN engine with the
+# recursive expansion it replaced
+#----------------------------------------------------
+import os
+import sys
+import unittest
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from MultiDBSCAN import MultiDBSCAN
+
+
+class RecursiveMultiDBSCAN(MultiDBSCAN):
+    """Seed selection and recursive expansion of the original engine"""
+    def fit_predict(self, X):
+        self.X = X
+        nbrs = NearestNeighbors(n_neighbors=self.k, metric="euclidean").fit(self.X)
+        self.k_dist, self.k_ind = nbrs.kneighbors(self.X)
+        self.aDST = dict(enumerate(np.sum(self.k_dist, axis=1)/(self.k-1)))
+        self.clusters = {}
+        self.nclust = 0
+        while self.aDST:
+            idat = min(self.aDST, key=self.aDST.get)
+            self.clusters[self.nclust] = [idat]
+            self.cluster_aDST = self.aDST[idat]
+            self.aDST.pop(idat, None)
+            self.cluster_expand(idat)
+            if len(self.clusters[self.nclust])<20:
+                self.clusters.pop(self.nclust, None)
+            self.nclust += 1
+        return self.clusters
+
+    def cluster_expand(self, idat):
+        for qq in self.k_ind[idat, :]:
+            if (qq in self.aDST) and (self.aDST[qq]<=self.var*self.cluster_aDST):
+                self.clusters[self.nclust].append(qq)
+                lcluster = len(self.clusters[self.nclust])
+                self.cluster_aDST = (self.cluster_aDST*(lcluster-1)+self.aDST[qq])/lcluster
+                self.aDST.pop(qq, None)
+                self.cluster_expand(qq)
+
+
+def mixture(npoints, seed, decimals=None):
+    """Standardized 3-d gaussian mixture of different densities with 5% noise"""
+    rand = np.random.RandomState(seed)
+    centers = rand.uniform(-10, 10, size=(4, 3))
+    scales = [0.3, 0.6, 1.0, 1.5]
+    nnoise = npoints//20
+    labels = rand.randint(0, len(centers), size=npoints-nnoise)
+    X = centers[labels]+rand.normal(size=(npoints-nnoise, 3))*np.take(scales, labels)[:, None]
+    X = np.vstack([X, rand.uniform(-15, 15, size=(nnoise, 3))])
+    X = (X-X.mean(axis=0))/X.std(axis=0)
+    if decimals is not None:
+        X = np.round(X, decimals)
+    return X
+
+
+class MultiDBSCANParityTest(unittest.TestCase):
+    """The iterative engine returns the clusters of the recursive one"""
+    def setUp(self):
+        self.limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(10000)
+
+    def tearDown(self):
+        sys.setrecursionlimit(self.limit)
+
+    def check(self, X, k=10, var=2):
+        mdbscan = MultiDBSCAN(k, var)
+        clusters = mdbscan.fit_predict(X)
+        expected = RecursiveMultiDBSCAN(k, var).fit_predict(X)
+        self.assertTrue(expected)
+        self.assertEqual(list(clusters.keys()), list(expected.keys()))
+        for key in expected:
+            self.assertEqual([int(ii) for ii in clusters[key]], [int(ii) for ii in expected[key]])
+        return mdbscan
+
+    def test_mixtures(self):
+        for seed in range(5):
+            self.check(mixture(2000, seed))
+
+    def test_tied_distances(self):
+        # points on a coarse grid share distances and average distances
+        for X, k, var in [(mixture(2000, 0, decimals=1), 10, 2), (np.round(mixture(2000, 1)*4)/4, 8, 1.5)]:
+            mdbscan = self.check(X, k, var)
+            self.assertLess(len(np.unique(mdbscan.aDST)), len(mdbscan.aDST))
+
+
+if __name__ == "__main__":
+    unittest.main()
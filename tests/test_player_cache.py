@@ -0,0 +1,87 @@
+#----------------------------------------------------
+# test_player_cache.py
+#
+# on-disk tier of ResultCache on a synthetic database
+#----------------------------------------------------
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from Player import Player, ResultCache
+from test_player_memory import synthetic_db
+
+NPLAYERS = 20
+
+
+def disk_files(directory):
+    """Files of the on-disk tier and their total size"""
+    names = sorted(os.listdir(directory))
+    return names, sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+
+
+class ResultCacheDiskTest(unittest.TestCase):
+    """Files of the on-disk tier are bounded and follow the ingest version"""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbname = os.path.join(self.tmpdir, "synthetic.db")
+        synthetic_db(self.dbname, NPLAYERS)
+        self.db = sqlite3.connect(self.dbname)
+        self.db.execute("CREATE TABLE ingest_version (version INTEGER)")
+        self.db.execute("INSERT INTO ingest_version VALUES (0)")
+        self.db.commit()
+        self.directory = os.path.join(self.tmpdir, "cache")
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def pitches(self, cache, pid):
+        return Player.from_id(pid, self.db, cache=cache, retain=False).pitches()
+
+    def test_restart(self):
+        cache = ResultCache(self.db, directory=self.directory)
+        frame = self.pitches(cache, 1)
+        names, size = disk_files(self.directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].endswith(".pkl"))
+        # a new process reads the file instead of the database
+        cache = ResultCache(sqlite3.connect(self.dbname), directory=self.directory)
+        cache.check()
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertTrue(self.pitches(cache, 1).equals(frame))
+
+    def test_ingest_version(self):
+        cache = ResultCache(self.db, directory=self.directory)
+        for pid in range(1, 6):
+            self.pitches(cache, pid)
+        self.assertEqual(len(os.listdir(self.directory)), 5)
+        self.db.execute("UPDATE ingest_version SET version=version+1")
+        self.db.commit()
+        self.pitches(cache, 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        # a cache opened later drops the files of other versions too
+        self.pitches(cache, 2)
+        self.db.execute("UPDATE ingest_version SET version=version+1")
+        self.db.commit()
+        ResultCache(sqlite3.connect(self.dbname), directory=self.directory).check()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_max_disk_bytes(self):
+        cache = ResultCache(self.db, directory=self.directory)
+        self.pitches(cache, 1)
+        size = disk_files(self.directory)[1]
+        cache = ResultCache(self.db, directory=self.directory, max_disk_bytes=3*size+size//2)
+        for pid in range(1, NPLAYERS+1):
+            self.pitches(cache, pid)
+            names, total = disk_files(self.directory)
+            self.assertLessEqual(total, cache.max_disk_bytes)
+        self.assertEqual(len(names), 3)
+        self.assertFalse([name for name in names if not name.endswith(".pkl")])
+
+
+if __name__ == "__main__":
+    unittest.main()
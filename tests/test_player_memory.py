@@ -0,0 +1,112 @@
+#----------------------------------------------------
+# test_player_memory.py
+#
+# memory regression test of Player objects held by a
+# long-lived service, on a synthetic database
+#----------------------------------------------------
+import gc
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from Player import Player, PITCHFX_COLUMNS, PITCHFX_EVENT_COLUMNS
+
+# size of the synthetic database
+NPLAYERS = 500
+NGAMES = 10
+NPITCHES = 30
+
+# growth of the RSS from player 100 to player 500 allowed without retaining
+MAX_GROWTH = 16*2**20
+
+
+def rss():
+    """Resident set size of this process in bytes"""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+
+
+def synthetic_db(dbname, nplayers=NPLAYERS):
+    """Fill a database with pitchers of NGAMES games each"""
+    db = sqlite3.connect(dbname)
+    pitch_columns = [name.strip() for name in PITCHFX_COLUMNS.split(",")]+PITCHFX_EVENT_COLUMNS
+    db.execute("CREATE TABLE players (player_id INTEGER, player_first TEXT, player_last TEXT, "
+               "position TEXT, bats TEXT, throws TEXT, dob INTEGER)")
+    db.execute("CREATE TABLE games (game_id INTEGER, game_type TEXT, date INTEGER)")
+    db.execute("CREATE TABLE events (game_id INTEGER, event_id INTEGER, event_description TEXT, "
+               "pitcher_id INTEGER, batter_id INTEGER)")
+    db.execute("CREATE TABLE pitchfx (%s)" %(", ".join(pitch_columns)))
+    rand = random.Random(0)
+    game_id = 0
+    for pid in range(1, nplayers+1):
+        db.execute("INSERT INTO players VALUES (?, ?, ?, 'P', 'R', 'R', 19800101)", (pid, "F%d" %(pid), "L%d" %(pid)))
+        games, events, pitches = [], [], []
+        for gg in range(NGAMES):
+            game_id += 1
+            games.append((game_id, "R", 20080401+gg))
+            for event_id in range(NPITCHES//5):
+                events.append((game_id, event_id, "Groundout", pid, nplayers+event_id))
+            for pitch_num in range(NPITCHES):
+                row = dict((name, rand.random()*100) for name in pitch_columns)
+                row.update(game_id=game_id, pitch_num=pitch_num, cur_event=pitch_num//5,
+                           description="Ball", outcome="B", pitch_type=rand.choice(["FF", "SL", "CH"]),
+                           pitcher_id=pid, batter_id=nplayers+pitch_num//5)
+                pitches.append(tuple(row[name] for name in pitch_columns))
+        db.executemany("INSERT INTO games VALUES (?, ?, ?)", games)
+        db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", events)
+        db.executemany("INSERT INTO pitchfx VALUES (%s)" %(", ".join("?"*len(pitch_columns))), pitches)
+    db.execute("CREATE INDEX pitchfx_pitcher ON pitchfx (pitcher_id, game_id, pitch_num)")
+    db.execute("CREATE INDEX events_pitcher ON events (pitcher_id)")
+    db.commit()
+    db.close()
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs /proc to read the RSS")
+class PlayerMemoryTest(unittest.TestCase):
+    """RSS of a service holding NPLAYERS players"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.dbname = os.path.join(cls.tmpdir, "synthetic.db")
+        synthetic_db(cls.dbname)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def hold_players(self, retain):
+        """Query and hold every player, RSS growth from player 100 on"""
+        db = sqlite3.connect(self.dbname)
+        held = []
+        try:
+            for pid in range(1, NPLAYERS+1):
+                player = Player.from_id(pid, db, retain=retain)
+                self.assertEqual(len(player.pitches()), NGAMES*NPITCHES)
+                player.pitch_events()
+                player.pitch_games()
+                held.append(player)
+                if pid == 100:
+                    gc.collect()
+                    start = rss()
+            gc.collect()
+            return rss()-start
+        finally:
+            db.close()
+
+    def test_flat_without_retain(self):
+        growth = self.hold_players(False)
+        self.assertLess(growth, MAX_GROWTH, "RSS grew %.1f MB over %d players" %(growth/2.**20, NPLAYERS-100))
+
+    def test_grows_with_retain(self):
+        # the same loop keeping results must be caught by the bound above
+        growth = self.hold_players(True)
+        self.assertGreater(growth, MAX_GROWTH)
+
+
+if __name__ == "__main__":
+    unittest.main()